@@ -1,4 +1,3 @@
-import os
 try:
     from fastapi import FastAPI, HTTPException, Request
     from fastapi.responses import StreamingResponse, JSONResponse, HTMLResponse
@@ -12,18 +11,34 @@ import html
 templates = Jinja2Templates(directory="templates")
 from pydantic import BaseModel
 from typing import List, Optional
-import ollama
+from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
 import config
 from utils.parser import parse_full_github_user, parse_repo
+from utils.github_scheduler import github_priority, QUICK, DETAILED, GitHubRateLimitError
 from utils.summarize_git import critique_code_dict
+from utils.llm import agenerate_code_roast, ollama_pool, LLM_SCHEDULER
+from utils.llm_scheduler import LLMOverloadedError
+from utils.model_manager import MODELS
+from utils.prompts import summary_sections
+
+def overloaded(e):
+    """503 with Retry-After for a roast turned away by the LLM scheduler."""
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after))})
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load the default model(s) before the first roast asks for them
+    MODELS.warm_up()
+    yield
 
 # App instance
-app = FastAPI(title="Roast My Code UI and API")
+app = FastAPI(title="Roast My Code UI and API", lifespan=lifespan)
 
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     """Render the main Roast My Code UI."""
-    models = list_models()
+    models = await list_models()
     roast_styles = [r["name"] for r in config.ROAST_STYLES]
     examples = config.EXAMPLE_SNIPPETS
     return templates.TemplateResponse(
@@ -47,31 +62,20 @@ async def roast_code_snippet_html(request: Request):
     form = await request.form()
     code = form.get("code", "")
     roast_style = form.get("roast_style", "")
-    model = form.get("model", list_models()[0])
+    model = form.get("model") or (await list_models())[0]
     detailed = "detailed" in form
-    roast_style_mod = roast_style + (" (mention specific files)" if detailed else " (use at most 3 sentences)")
-    prompt = config.PROMPT_CODE_SNIPPET_TEMPLATE.format(code=code, roast_style=roast_style_mod)
     try:
-        gen = ollama.generate(model=model, prompt=prompt, stream=False)
-        content = "".join(chunk.get("response", "") for chunk in gen)
+        content = await agenerate_code_roast(code, roast_style, detailed=detailed, model=model, stream=False)
+    except LLMOverloadedError as e:
+        raise overloaded(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating roast: {e}")
     escaped = html.escape(content)
     return HTMLResponse(f"<div id=\"roastResult\"><pre>{escaped}</pre></div>")
 
-# Initialize Ollama client (default to localhost)
-OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
-ollama.Client(host=OLLAMA_HOST)
-
-def list_models() -> List[str]:
-    resp = ollama.list().get("models", [])
-    models = []
-    for m in resp:
-        if hasattr(m, "model"):
-            models.append(m.model)
-        elif isinstance(m, dict) and "model" in m:
-            models.append(m["model"])
-    return models
+async def list_models() -> List[str]:
+    # Cached by the model manager and refreshed in the background
+    return await MODELS.anames()
 
 class CodeRoastRequest(BaseModel):
     code: str
@@ -89,12 +93,25 @@ class GitHubRoastRequest(BaseModel):
     stream: bool = True
 
 @app.get("/models")
-def get_models():
+async def get_models():
+    try:
+        return {"models": await list_models()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/models/loaded")
+async def get_loaded_models():
+    """Models currently loaded in Ollama's memory."""
     try:
-        return {"models": list_models()}
+        return {"models": await MODELS.aloaded()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/llm/queue")
+def get_llm_queue():
+    """LLM scheduler load, queue wait times per priority class, and the state of each Ollama host."""
+    return {**LLM_SCHEDULER.stats(), "hosts": ollama_pool().stats()}
+
 @app.get("/roast_styles")
 def get_roast_styles():
     return {"roast_styles": config.ROAST_STYLES}
@@ -105,66 +122,64 @@ def get_examples():
 
 @app.post("/roast/code-snippet")
 async def roast_code_snippet(request: CodeRoastRequest):
-    models = list_models()
+    models = await list_models()
     if not models:
         raise HTTPException(status_code=400, detail="No models available")
     model = request.model or models[0]
-    roast_style_mod = (
-        request.roast_style
-        + (" (mention specific files)" if request.detailed else " (use at most 3 sentences)")
-    )
-    prompt = config.PROMPT_CODE_SNIPPET_TEMPLATE.format(
-        code=request.code, roast_style=roast_style_mod
-    )
     try:
-        gen = ollama.generate(model=model, prompt=prompt, stream=request.stream)
+        if request.stream:
+            stream = await agenerate_code_roast(request.code, request.roast_style, detailed=request.detailed, model=model)
+            return StreamingResponse(stream, media_type="text/plain")
+        content = await agenerate_code_roast(
+            request.code, request.roast_style, detailed=request.detailed, model=model, stream=False
+        )
+    except LLMOverloadedError as e:
+        raise overloaded(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating roast: {e}")
-    if request.stream:
-        def iter_response():
-            for chunk in gen:
-                yield chunk.get("response", "")
-        return StreamingResponse(iter_response(), media_type="text/plain")
-    content = "".join(chunk.get("response", "") for chunk in gen)
     return JSONResponse({"roast": content})
 
 @app.post("/roast/github-profile")
 async def roast_github_profile(request: GitHubRoastRequest):
-    try:
-        if request.repository:
-            code_dict = parse_repo(
-                request.profile,
-                request.repository,
-                depth=(1 if not request.detailed else 2),
-            )
-        else:
-            code_dict = parse_full_github_user(
-                request.profile, depth=(0 if not request.detailed else 1)
-            )
-        summary = critique_code_dict(code_dict)
-        snippet = "\n".join(f"{k}: {v}" for k, v in summary.items())
-        snippet += f"\nSummary for the user {request.profile}:"
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching or summarizing code: {e}")
-    models = list_models()
+    models = await list_models()
     if not models:
         raise HTTPException(status_code=400, detail="No models available")
     model = request.model or models[0]
-    roast_style_mod = (
-        request.roast_style
-        + (" (mention specific files)" if request.detailed else " (use at most 3 sentences)")
-    )
-    prompt = config.PROMPT_GITHUB_PROFILE_TEMPLATE.format(
-        code=snippet, roast_style=roast_style_mod
-    )
+
+    def summarize():
+        with github_priority(DETAILED if request.detailed else QUICK):
+            if request.repository:
+                code_dict = parse_repo(
+                    request.profile,
+                    request.repository,
+                    depth=(1 if not request.detailed else 2),
+                )
+            else:
+                code_dict = parse_full_github_user(
+                    request.profile, depth=(0 if not request.detailed else 1)
+                )
+        return critique_code_dict(code_dict, model=model)
+
+    try:
+        # Parsing and the critique stage are blocking and run off the event loop
+        summary = await run_in_threadpool(summarize)
+        sections = summary_sections(summary, request.profile)
+    except GitHubRateLimitError as e:
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)}
+        )
+    except LLMOverloadedError as e:
+        raise overloaded(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching or summarizing code: {e}")
+    roast = dict(detailed=request.detailed, type="github profile", model=model)
     try:
-        gen = ollama.generate(model=model, prompt=prompt, stream=request.stream)
+        if request.stream:
+            stream = await agenerate_code_roast(sections, request.roast_style, **roast)
+            return StreamingResponse(stream, media_type="text/plain")
+        content = await agenerate_code_roast(sections, request.roast_style, stream=False, **roast)
+    except LLMOverloadedError as e:
+        raise overloaded(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating roast: {e}")
-    if request.stream:
-        def iter_response():
-            for chunk in gen:
-                yield chunk.get("response", "")
-        return StreamingResponse(iter_response(), media_type="text/plain")
-    content = "".join(chunk.get("response", "") for chunk in gen)
     return JSONResponse({"roast": content})
\ No newline at end of file
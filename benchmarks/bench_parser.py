@@ -0,0 +1,174 @@
+"""
+Offline benchmark for utils.parser against the fake GitHub in fake_github.py.
+
+For every fixture profile size, parse mode and depth it runs parse_repo (on
+the first pinned repository) and parse_full_github_user, then reads the
+first PREFIX_CHARS of every returned file like the summary stage would. Each
+case runs twice: cold (empty caches) and warm (caches from the cold run).
+Reported per case: GitHub requests, bytes transferred and wall time.
+
+Usage:
+    python -m benchmarks.bench_parser
+    python -m benchmarks.bench_parser --sizes small medium --modes tree --depths 1
+    python -m benchmarks.bench_parser --baseline benchmarks/baseline.json      # CI regression check
+    python -m benchmarks.bench_parser --write-baseline benchmarks/baseline.json
+
+Request counts are deterministic, so the baseline check compares those only;
+wall time depends on the machine and is just reported.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Configure the parser before it is imported: private cache file, a dummy
+# token (the fake server accepts anything), no pacing and no progress bars.
+os.environ["CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="roast-bench-"), "cache.sqlite3")
+os.environ.setdefault("GITHUB_TOKEN", "fixture-token")
+os.environ["GITHUB_TOKENS"] = ""
+os.environ["GITHUB_REQUESTS_PER_SECOND"] = "1000000"
+os.environ["GITHUB_BURST"] = "1000000"
+os.environ["TQDM_DISABLE"] = "1"
+
+from benchmarks.fake_github import serve  # noqa: E402
+from benchmarks.fixtures import PROFILE_SIZES  # noqa: E402
+from utils import parser  # noqa: E402
+
+MODES = ("contents", "tree", "archive")
+
+# Characters read from every file, about what the summary stage reads per file
+PREFIX_CHARS = 1000
+
+
+def read_prefixes(repo_dict):
+    """Read the start of every file; returns the number of files read."""
+    count = 0
+    for value in repo_dict.values():
+        if isinstance(value, dict):
+            count += read_prefixes(value)
+        elif isinstance(value, parser.LazyFile):
+            value.read(PREFIX_CHARS)
+            count += 1
+    return count
+
+
+def run_case(fake, target, login, repo, mode, depth):
+    """Run one case and return the stats of its cold and warm runs."""
+    parser.GITHUB_PARSE_MODE = mode
+    parser.HTTP_CACHE.clear()
+    parser.BLOB_STORE.clear()
+    results = {}
+    for phase in ("cold", "warm"):
+        fake.reset_stats()
+        budget = parser.ParseBudget(max_files=0, max_bytes=0, max_seconds=0)
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            if target == "parse_repo":
+                parsed = parser.parse_repo(login, repo, depth=depth, mode=mode, budget=budget)
+            else:
+                parsed = parser.parse_full_github_user(login, depth=depth, budget=budget)
+            files = read_prefixes(parsed)
+        elapsed = time.perf_counter() - started
+        stats = fake.stats()
+        results[phase] = {
+            "requests": stats["requests"],
+            "bytes": stats["bytes"],
+            "seconds": round(elapsed, 3),
+            "files": files,
+            "by_endpoint": stats["by_endpoint"],
+        }
+    return results
+
+
+def run(sizes, modes, depths):
+    fake = serve(sizes)
+    parser.GITHUB_API_URL = fake.url
+    parser.GITHUB_RAW_URL = fake.raw_url
+    results = []
+    try:
+        for size in sizes:
+            profile = next(p for p in fake.profiles.values() if p.size == size)
+            for mode in modes:
+                for depth in depths:
+                    for target in ("parse_repo", "parse_full_github_user"):
+                        case = run_case(fake, target, profile.login, profile.pinned[0].name, mode, depth)
+                        results.append({"size": size, "mode": mode, "depth": depth, "target": target, **case})
+    finally:
+        fake.stop()
+    return results
+
+
+def print_table(results):
+    header = (f"{'size':<7}{'mode':<10}{'depth':>5}  {'target':<24}{'files':>6}"
+              f"{'cold req':>10}{'cold KB':>10}{'cold s':>9}{'warm req':>10}{'warm KB':>10}{'warm s':>9}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        cold, warm = r["cold"], r["warm"]
+        print(f"{r['size']:<7}{r['mode']:<10}{r['depth']:>5}  {r['target']:<24}{cold['files']:>6}"
+              f"{cold['requests']:>10}{cold['bytes'] / 1024:>10.1f}{cold['seconds']:>9.3f}"
+              f"{warm['requests']:>10}{warm['bytes'] / 1024:>10.1f}{warm['seconds']:>9.3f}")
+
+
+def case_key(r):
+    return f"{r['size']}/{r['mode']}/depth{r['depth']}/{r['target']}"
+
+
+def check_baseline(results, path, tolerance):
+    """Return a list of regressions in request counts compared to a stored baseline."""
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = []
+    for r in results:
+        expected = baseline.get(case_key(r))
+        if not expected:
+            continue
+        for phase in ("cold", "warm"):
+            allowed = expected[phase] * (1 + tolerance)
+            if r[phase]["requests"] > allowed:
+                regressions.append(
+                    f"{case_key(r)} {phase}: {r[phase]['requests']} requests (baseline {expected[phase]})"
+                )
+    return regressions
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    arg_parser.add_argument("--sizes", nargs="+", default=list(PROFILE_SIZES), choices=list(PROFILE_SIZES))
+    arg_parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    arg_parser.add_argument("--depths", nargs="+", type=int, default=[0, 1, 2])
+    arg_parser.add_argument("--json", help="Write the full results to this file")
+    arg_parser.add_argument("--baseline", help="Fail if request counts exceed this baseline file")
+    arg_parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative increase (default 0.1)")
+    arg_parser.add_argument("--write-baseline", help="Store the request counts of this run as a baseline")
+    args = arg_parser.parse_args(argv)
+
+    results = run(args.sizes, args.modes, args.depths)
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.write_baseline:
+        with open(args.write_baseline, "w", encoding="utf-8") as f:
+            json.dump(
+                {case_key(r): {"cold": r["cold"]["requests"], "warm": r["warm"]["requests"]} for r in results},
+                f, indent=2, sort_keys=True,
+            )
+            f.write("\n")
+    if args.baseline:
+        regressions = check_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            print("\nRequest count regressions:")
+            print("\n".join(regressions))
+            return 1
+        print("\nNo request count regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Time-to-first-token of roasts with and without a reusable prompt prefix.
+
+Needs a running Ollama (OLLAMA_HOST / OLLAMA_HOSTS) with the given model. For
+every layout it roasts the example snippets in one style, one after another:
+
+- "chat": instructions and style as the system message, the code as the user
+  message (what utils.llm sends). All calls share the system message as their
+  prefix, so Ollama only evaluates it for the first call.
+- "inline": one user message with the code first and the same instructions
+  after it, like the former GitHub profile prompt. Nothing is shared.
+
+Reported per layout: time to first token and prompt tokens evaluated (Ollama's
+prompt_eval_count), for the first call and the median of the others.
+
+Usage:
+    python -m benchmarks.bench_prefix --model llama3.2
+    python -m benchmarks.bench_prefix --model llama3.2 --style "Tech Bro" --runs 3
+"""
+import argparse
+import os
+import statistics
+import time
+
+os.environ["ROAST_CACHE_TTL"] = "0"
+
+from config import EXAMPLE_SNIPPETS, ROAST_STYLES  # noqa: E402
+from utils.llm import build_roast_prompt, get_llm_response  # noqa: E402
+
+
+def measure(prompt, model, system=None):
+    """Stream one answer and return (seconds to the first token, prompt tokens evaluated)."""
+    start = time.perf_counter()
+    ttft, evaluated = None, None
+    for chunk in get_llm_response(prompt, stream=True, model=model, system=system):
+        if ttft is None and chunk["response"]:
+            ttft = time.perf_counter() - start
+        if chunk["done"]:
+            evaluated = chunk.get("prompt_eval_count")
+    return ttft or time.perf_counter() - start, evaluated
+
+
+def run(model, style, runs):
+    results = {}
+    for layout in ("chat", "inline"):
+        samples = []
+        for _ in range(runs):
+            for snippet in EXAMPLE_SNIPPETS:
+                build = build_roast_prompt(snippet["code"], style, model=model)
+                if layout == "chat":
+                    samples.append(measure(build.prompt, model, system=build.system))
+                else:
+                    samples.append(measure(build.prompt + "\n" + build.system, model))
+        results[layout] = samples
+    return results
+
+
+def print_table(results):
+    print(f"{'layout':<8}{'first ttft':>12}{'first eval':>12}{'ttft p50':>10}{'eval p50':>10}")
+    for layout, samples in results.items():
+        (first_ttft, first_eval), rest = samples[0], samples[1:] or samples
+        evals = [evaluated for _, evaluated in rest if evaluated is not None]
+        print(f"{layout:<8}{first_ttft:>11.3f}s{first_eval or 0:>12}"
+              f"{statistics.median(t for t, _ in rest):>9.3f}s{statistics.median(evals) if evals else 0:>10.0f}")
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    arg_parser.add_argument("--model", required=True, help="Ollama model to roast with")
+    arg_parser.add_argument("--style", default=ROAST_STYLES[0]["name"], help="Roast style (default the first one)")
+    arg_parser.add_argument("--runs", type=int, default=1, help="Passes over the example snippets per layout")
+    args = arg_parser.parse_args(argv)
+    print_table(run(args.model, args.style, args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Local stand-in for the parts of api.github.com and raw.githubusercontent.com
+used by utils.parser: users, repos, events, contents, git trees/blobs,
+tarballs, raw downloads (with Range) and the GraphQL queries.
+
+It serves FixtureProfile data, honours If-None-Match, sends X-RateLimit-*
+headers and counts requests and bytes so benchmarks can report them.
+"""
+import base64
+import hashlib
+import json
+import re
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+from benchmarks.fixtures import FixtureProfile, git_blob_sha
+
+
+class FakeGitHub:
+    def __init__(self, profiles):
+        """
+        Args:
+            profiles (list[FixtureProfile]): Profiles to serve, looked up by login.
+        """
+        self.profiles = {p.login: p for p in profiles}
+        self.requests = Counter()
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    # -----------------------------
+    # LIFECYCLE
+    # -----------------------------
+    def start(self):
+        fake = self
+
+        class Handler(FakeGitHubHandler):
+            server_state = fake
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    @property
+    def raw_url(self):
+        return self.url + "/raw"
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests.clear()
+            self.bytes_sent = 0
+
+    def stats(self):
+        with self._lock:
+            return {"requests": sum(self.requests.values()), "bytes": self.bytes_sent, "by_endpoint": dict(self.requests)}
+
+    def _record(self, endpoint, size):
+        with self._lock:
+            self.requests[endpoint] += 1
+            self.bytes_sent += size
+
+    # -----------------------------
+    # LOOKUPS
+    # -----------------------------
+    def find_repo(self, owner, name):
+        profile = self.profiles.get(owner)
+        return profile.repo(owner, name) if profile else None
+
+    def repo_json(self, repo):
+        return {
+            "name": repo.name,
+            "owner": {"login": repo.owner},
+            "description": repo.description,
+            "language": "Python",
+            "stargazers_count": repo.stars,
+            "updated_at": repo.updated_at,
+            "default_branch": "main",
+        }
+
+    def repo_node(self, repo):
+        return {
+            "name": repo.name,
+            "description": repo.description,
+            "primaryLanguage": {"name": "Python"},
+            "stargazerCount": repo.stars,
+            "updatedAt": repo.updated_at,
+            "owner": {"login": repo.owner},
+        }
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_state = None  # set on the subclass created by FakeGitHub.start
+
+    def log_message(self, *args):
+        pass
+
+    # -----------------------------
+    # RESPONSES
+    # -----------------------------
+    def _send(self, endpoint, status, body=b"", content_type="application/json", headers=None):
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            status, body = 304, b""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("X-RateLimit-Limit", "5000")
+        self.send_header("X-RateLimit-Remaining", "4999")
+        self.send_header("X-RateLimit-Reset", "9999999999")
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server_state._record(endpoint if status != 304 else endpoint + " (304)", len(body))
+
+    def _json(self, endpoint, data, status=200):
+        self._send(endpoint, status, json.dumps(data).encode())
+
+    def _not_found(self, endpoint):
+        self._json(endpoint, {"message": "Not Found"}, status=404)
+
+    # -----------------------------
+    # REST
+    # -----------------------------
+    def do_GET(self):
+        state = self.server_state
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        path = unquote(parsed.path)
+
+        m = re.fullmatch(r"/users/([^/]+)", path)
+        if m:
+            profile = state.profiles.get(m.group(1))
+            return self._json("users", profile.user()) if profile else self._not_found("users")
+
+        m = re.fullmatch(r"/users/([^/]+)/repos", path)
+        if m:
+            profile = state.profiles.get(m.group(1))
+            if not profile:
+                return self._not_found("repos")
+            per_page = int(query.get("per_page", ["30"])[0])
+            page = int(query.get("page", ["1"])[0])
+            repos = profile.repos[(page - 1) * per_page: page * per_page]
+            return self._json("repos", [state.repo_json(r) for r in repos])
+
+        m = re.fullmatch(r"/users/([^/]+)/events/public", path)
+        if m:
+            profile = state.profiles.get(m.group(1))
+            return self._json("events", profile.events) if profile else self._not_found("events")
+
+        m = re.fullmatch(r"/repos/([^/]+)/([^/]+)/contents/?(.*)", path)
+        if m:
+            return self._contents(state.find_repo(m.group(1), m.group(2)), m.group(3).strip("/"))
+
+        m = re.fullmatch(r"/repos/([^/]+)/([^/]+)/git/trees/([^/]+)", path)
+        if m:
+            repo = state.find_repo(m.group(1), m.group(2))
+            if not repo:
+                return self._not_found("trees")
+            tree = [
+                {
+                    "path": p,
+                    "type": kind,
+                    "sha": git_blob_sha(repo.files[p]) if kind == "blob" else hashlib.sha1(p.encode()).hexdigest(),
+                    "size": len(repo.files[p]) if kind == "blob" else None,
+                    "url": f"{state.url}/repos/{repo.owner}/{repo.name}/git/blobs/"
+                           + (git_blob_sha(repo.files[p]) if kind == "blob" else ""),
+                }
+                for p, kind in repo.tree_entries()
+            ]
+            for entry in tree:
+                if entry["size"] is None:
+                    del entry["size"]
+            return self._json("trees", {"sha": "HEAD", "tree": tree, "truncated": False})
+
+        m = re.fullmatch(r"/repos/([^/]+)/([^/]+)/git/blobs/([0-9a-f]+)", path)
+        if m:
+            repo = state.find_repo(m.group(1), m.group(2))
+            data = repo.blob(m.group(3)) if repo else None
+            if data is None:
+                return self._not_found("blobs")
+            return self._json("blobs", {
+                "sha": m.group(3), "size": len(data), "encoding": "base64",
+                "content": base64.b64encode(data).decode(),
+            })
+
+        m = re.fullmatch(r"/repos/([^/]+)/([^/]+)/tarball/?(.*)", path)
+        if m:
+            repo = state.find_repo(m.group(1), m.group(2))
+            if not repo:
+                return self._not_found("tarball")
+            return self._send("tarball", 200, repo.tarball(), content_type="application/x-gzip")
+
+        m = re.fullmatch(r"/raw/([^/]+)/([^/]+)/[^/]+/(.+)", path)
+        if m:
+            return self._raw(state.find_repo(m.group(1), m.group(2)), m.group(3))
+
+        return self._not_found("unknown")
+
+    def _contents(self, repo, path):
+        state = self.server_state
+        if not repo:
+            return self._not_found("contents")
+        base = f"{state.url}/repos/{repo.owner}/{repo.name}/contents"
+        raw = f"{state.raw_url}/{repo.owner}/{repo.name}/main"
+        if path in repo.files:
+            data = repo.files[path]
+            return self._json("contents file", {
+                "name": path.split("/")[-1], "path": path, "sha": git_blob_sha(data), "size": len(data),
+                "type": "file", "encoding": "base64", "content": base64.b64encode(data).decode(),
+            })
+        if path and path not in repo.dirs:
+            return self._not_found("contents")
+        items = []
+        for name, item_path, is_dir in repo.listing(path):
+            item = {"name": name, "path": item_path, "url": f"{base}/{item_path}"}
+            if is_dir:
+                item.update(type="dir", size=0, sha=hashlib.sha1(item_path.encode()).hexdigest(), download_url=None)
+            else:
+                data = repo.files[item_path]
+                item.update(type="file", size=len(data), sha=git_blob_sha(data), download_url=f"{raw}/{item_path}")
+            items.append(item)
+        return self._json("contents listing", items)
+
+    def _raw(self, repo, path):
+        if not repo or path not in repo.files:
+            return self._not_found("raw")
+        data = repo.files[path]
+        range_header = self.headers.get("Range")
+        m = re.fullmatch(r"bytes=(\d+)-(\d*)", range_header or "")
+        if not m:
+            return self._send("raw", 200, data, content_type="text/plain")
+        start = int(m.group(1))
+        end = min(int(m.group(2)) if m.group(2) else len(data) - 1, len(data) - 1)
+        return self._send(
+            "raw", 206, data[start:end + 1], content_type="text/plain",
+            headers={"Content-Range": f"bytes {start}-{end}/{len(data)}"},
+        )
+
+    # -----------------------------
+    # GRAPHQL
+    # -----------------------------
+    def do_POST(self):
+        state = self.server_state
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if urlparse(self.path).path != "/graphql":
+            return self._not_found("unknown")
+
+        query = payload.get("query", "")
+        variables = payload.get("variables", {})
+        profile = state.profiles.get(variables.get("login"))
+        if not profile:
+            return self._json("graphql", {"data": {"user": None}, "errors": [{"message": "Could not resolve user"}]})
+
+        pinned = {"nodes": [{"name": r.name, "owner": {"login": r.owner}} for r in profile.pinned]}
+        by_stars = sorted(profile.repos, key=lambda r: (-r.stars, r.name))
+        offset = int(variables.get("cursor") or 0)
+        page = by_stars[offset:offset + 100]
+        stars_connection = {
+            "totalCount": len(by_stars),
+            "pageInfo": {"hasNextPage": offset + 100 < len(by_stars), "endCursor": str(offset + 100)},
+            "nodes": [state.repo_node(r) for r in page],
+        }
+
+        if "contributionsCollection" in query:
+            recent = sorted(profile.repos, key=lambda r: r.updated_at, reverse=True)[:10]
+            user = profile.user()
+            data = {
+                "login": user["login"], "name": user["name"], "bio": user["bio"], "location": user["location"],
+                "websiteUrl": user["blog"], "email": "", "twitterUsername": None,
+                "followers": {"totalCount": user["followers"]}, "following": {"totalCount": user["following"]},
+                "createdAt": user["created_at"], "updatedAt": user["updated_at"],
+                "pinnedItems": pinned,
+                "byStars": stars_connection,
+                "recentlyUpdated": {"nodes": [state.repo_node(r) for r in recent]},
+                "contributionsCollection": {
+                    "commitContributionsByRepository": [
+                        {"repository": {"nameWithOwner": e["repo"]["name"]},
+                         "contributions": {"nodes": [{"occurredAt": e["created_at"]}]}}
+                        for e in profile.events[:5]
+                    ],
+                    "pullRequestContributions": {"nodes": []},
+                    "issueContributions": {"nodes": []},
+                },
+            }
+        elif "byStars" in query:
+            data = {"byStars": stars_connection}
+        else:
+            data = {"pinnedItems": pinned}
+        return self._json("graphql", {"data": {"user": data}})
+
+
+def serve(sizes=("small", "medium", "large")):
+    """Start a fake GitHub with the given fixture profiles and return it."""
+    return FakeGitHub([FixtureProfile(size) for size in sizes]).start()
+
+
+if __name__ == "__main__":
+    fake = serve()
+    print(f"Fake GitHub listening on {fake.url} (raw files under {fake.raw_url})")
+    print("Profiles: " + ", ".join(fake.profiles))
+    print(f"Point the app at it with GITHUB_API_URL={fake.url} GITHUB_RAW_URL={fake.raw_url}")
+    threading.Event().wait()
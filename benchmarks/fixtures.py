@@ -0,0 +1,170 @@
+"""
+Deterministic GitHub fixture profiles for the offline benchmarks.
+Every profile is generated from a fixed seed, so the same size always yields
+byte-identical repositories, listings and archives (and thus the same request
+counts).
+"""
+import hashlib
+import io
+import random
+import tarfile
+
+# name -> shape of the generated profile
+PROFILE_SIZES = {
+    "small": {"repos": 4, "pinned": 2, "files_per_dir": 4, "dirs_per_dir": 2, "levels": 2, "line_count": 40},
+    "medium": {"repos": 20, "pinned": 6, "files_per_dir": 8, "dirs_per_dir": 3, "levels": 3, "line_count": 80},
+    "large": {"repos": 130, "pinned": 6, "files_per_dir": 12, "dirs_per_dir": 3, "levels": 3, "line_count": 160},
+}
+
+# Same bytes in every repository, to exercise the blob store
+LICENSE = b"MIT License\n\nCopyright (c) fixture\n\nPermission is hereby granted, free of charge...\n" * 5
+
+EXTENSIONS = [".py", ".js", ".md", ".json", ".go", ".png"]
+
+WORDS = ["data", "value", "result", "temp", "foo", "bar", "handler", "manager", "thing", "stuff", "x", "y"]
+
+
+def git_blob_sha(data):
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def _code(rng, lines):
+    out = []
+    indent = 0
+    for _ in range(lines):
+        word = rng.choice(WORDS)
+        kind = rng.random()
+        if kind < 0.15:
+            out.append("    " * indent + f"def {word}_{rng.randint(0, 99)}({rng.choice(WORDS)}):")
+            indent = min(indent + 1, 4)
+        elif kind < 0.25:
+            out.append("    " * indent + f"if {word} == {rng.randint(0, 9)}:")
+            indent = min(indent + 1, 4)
+        elif kind < 0.3:
+            out.append("    " * indent + "# TODO: fix this later")
+        elif kind < 0.35 and indent:
+            indent -= 1
+            out.append("    " * indent + "return None")
+        else:
+            out.append("    " * indent + f"{word} = {rng.choice(WORDS)} + {rng.randint(0, 999)}")
+    return ("\n".join(out) + "\n").encode()
+
+
+class FixtureRepo:
+    def __init__(self, owner, name, rng, shape, stars, updated_at, description):
+        self.owner = owner
+        self.name = name
+        self.stars = stars
+        self.updated_at = updated_at
+        self.description = description
+        # path -> bytes for files, and the set of directory paths
+        self.files = {"LICENSE.txt": LICENSE, "README.md": f"# {name}\n\n{description}\n".encode()}
+        self.dirs = set()
+        self._fill(rng, shape, "", shape["levels"])
+        self._tarball = None
+        self._blobs = None
+
+    def _fill(self, rng, shape, prefix, levels):
+        for i in range(shape["files_per_dir"]):
+            ext = EXTENSIONS[i % len(EXTENSIONS)]
+            path = f"{prefix}file_{i}{ext}"
+            if ext == ".png":
+                self.files[path] = bytes(rng.getrandbits(8) for _ in range(256))
+            else:
+                self.files[path] = _code(rng, shape["line_count"] + rng.randint(0, shape["line_count"]))
+        if levels == 0:
+            return
+        for i in range(shape["dirs_per_dir"]):
+            path = f"{prefix}dir_{i}"
+            self.dirs.add(path)
+            self._fill(rng, shape, path + "/", levels - 1)
+
+    def listing(self, path):
+        """Children of a directory as (name, full path, is_dir), sorted like the contents API."""
+        prefix = path.strip("/") + "/" if path.strip("/") else ""
+        children = {}
+        for candidate in list(self.files) + list(self.dirs):
+            if not candidate.startswith(prefix) or candidate == path:
+                continue
+            name = candidate[len(prefix):].split("/")[0]
+            children[name] = (prefix + name) in self.dirs
+        return [(name, prefix + name, is_dir) for name, is_dir in sorted(children.items())]
+
+    def blob(self, sha):
+        if self._blobs is None:
+            self._blobs = {git_blob_sha(data): data for data in self.files.values()}
+        return self._blobs.get(sha)
+
+    def tree_entries(self):
+        entries = [(path, "tree") for path in self.dirs] + [(path, "blob") for path in self.files]
+        return sorted(entries)
+
+    def tarball(self):
+        if self._tarball is None:
+            root = f"{self.owner}-{self.name}-0000000/"
+            buf = io.BytesIO()
+            with tarfile.open(fileobj=buf, mode="w:gz") as archive:
+                entries = [(root, None)] + [
+                    (root + path + ("/" if kind == "tree" else ""), self.files.get(path) if kind == "blob" else None)
+                    for path, kind in self.tree_entries()
+                ]
+                for name, data in entries:
+                    info = tarfile.TarInfo(name)
+                    info.mtime = 0
+                    if data is None:
+                        info.type = tarfile.DIRTYPE
+                        archive.addfile(info)
+                    else:
+                        info.size = len(data)
+                        archive.addfile(info, io.BytesIO(data))
+            self._tarball = buf.getvalue()
+        return self._tarball
+
+
+class FixtureProfile:
+    def __init__(self, size):
+        shape = PROFILE_SIZES[size]
+        rng = random.Random(f"roast-fixture-{size}")
+        self.size = size
+        self.login = f"fixture-{size}"
+        self.repos = []
+        for i in range(shape["repos"]):
+            self.repos.append(FixtureRepo(
+                self.login,
+                f"repo-{i:03d}",
+                rng,
+                shape,
+                stars=rng.randint(0, 500),
+                updated_at=f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T12:00:00Z",
+                description=f"Fixture repository number {i}",
+            ))
+        self.pinned = self.repos[:shape["pinned"]]
+        self.events = [
+            {
+                "type": rng.choice(["PushEvent", "IssuesEvent", "PullRequestEvent"]),
+                "repo": {"name": f"{self.login}/{rng.choice(self.repos).name}"},
+                "created_at": f"2025-06-{d:02d}T10:00:00Z",
+            }
+            for d in range(28, 0, -1)
+        ]
+
+    def repo(self, owner, name):
+        if owner != self.login:
+            return None
+        return next((r for r in self.repos if r.name == name), None)
+
+    def user(self):
+        return {
+            "login": self.login,
+            "name": f"Fixture {self.size.title()}",
+            "bio": "I write code for benchmarks",
+            "location": "localhost",
+            "blog": "",
+            "email": None,
+            "twitter_username": None,
+            "followers": 42,
+            "following": 7,
+            "public_repos": len(self.repos),
+            "created_at": "2015-01-01T00:00:00Z",
+            "updated_at": "2025-06-28T00:00:00Z",
+        }
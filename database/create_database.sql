@@ -30,13 +30,24 @@ create table roast_my_code.clapback (
     roast_id integer,
     llm_response text not null,
     audio_url text,
+    -- estimated USD cost of the LLM calls (see utils/usage.py), for every backend
     open_api_cost float,
+    roast_type text,
+    detailed boolean,
+    backend text,
+    model text,
+    llm_calls integer,
+    prompt_tokens integer,
+    completion_tokens integer,
+    generation_seconds float,
     create_ts timestamp default CURRENT_TIMESTAMP,
     CONSTRAINT fk_roast 
         FOREIGN KEY(roast_id) 
         REFERENCES roast_my_code.roast(id)
 );
 
+create index clapback_create_ts on roast_my_code.clapback (create_ts);
+
 
 CREATE TABLE roast_my_code.payitforward_credits (
     id INT PRIMARY KEY,
@@ -0,0 +1,14 @@
+-- token and cost accounting per clapback (for databases created before these columns)
+-- run once: docker compose exec -T database psql -U postgres < database/migrations/001_clapback_usage.sql
+
+alter table roast_my_code.clapback
+    add column if not exists roast_type text,
+    add column if not exists detailed boolean,
+    add column if not exists backend text,
+    add column if not exists model text,
+    add column if not exists llm_calls integer,
+    add column if not exists prompt_tokens integer,
+    add column if not exists completion_tokens integer,
+    add column if not exists generation_seconds float;
+
+create index if not exists clapback_create_ts on roast_my_code.clapback (create_ts);
@@ -1,8 +1,9 @@
 from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
-import ollama
+from starlette.concurrency import run_in_threadpool
 import os
+from contextlib import asynccontextmanager
 from fastapi.staticfiles import StaticFiles
 
 from utils.speech import pipeline, cleanup_prompt, generate_tts_audio
@@ -11,20 +12,44 @@ from utils.stripe import create_checkout_session, process_webhook
 
 from config import EXAMPLE_SNIPPETS, ROAST_STYLES, VOICES, DEFAULT_VOICE
 from utils.parser import parse_full_github_user, parse_repo
+from utils.github_scheduler import github_priority, QUICK, DETAILED, GitHubRateLimitError
 from utils.summarize_git import critique_code_dict
-from utils.llm import generate_code_roast, get_model_names
+from utils.llm import agenerate_code_roast, LLM_SCHEDULER
+from utils.llm_scheduler import LLMOverloadedError, BACKGROUND
+from utils.model_manager import MODELS
+from utils.metrics import render as render_metrics
+from utils.prompts import summary_sections
+from utils.usage import track_usage
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # Load the default model(s) before the first roast asks for them
+    MODELS.warm_up()
+    yield
+
+app = FastAPI(lifespan=lifespan)
 os.makedirs("tts", exist_ok=True)
 app.mount("/tts", StaticFiles(directory="tts"), name="tts")
 templates = Jinja2Templates(directory="templates")
 
-if "OLLAMA_HOST" in os.environ:
-    ollama.Client(host=os.environ["OLLAMA_HOST"])
+def busy_response(e):
+    return HTMLResponse(
+        content="<div style='color:red;'>The roaster is busy right now. Please try again in a moment.</div>",
+        status_code=503,
+        headers={"Retry-After": str(int(e.retry_after))},
+    )
+
+@app.exception_handler(LLMOverloadedError)
+async def llm_overloaded(request: Request, e: LLMOverloadedError):
+    # Roasts that got past the check below but found the LLM queue full meanwhile
+    # get their credit back
+    if getattr(request.state, "credit_spent", False):
+        increment_credits(1)
+    return busy_response(e)
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
-    models = get_model_names()
+    models = await MODELS.anames()
     # Pass only style names to the template; descriptions are applied server-side
     roast_styles = [r['name'] for r in ROAST_STYLES]
     # Fetch remaining pay-it-forward credits
@@ -43,6 +68,12 @@ async def index(request: Request):
     })
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Stage latencies, LLM throughput, GitHub calls and cache hits for Prometheus to scrape."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/example", response_class=HTMLResponse)
 async def example(example: str):
     snippet = next((ex for ex in EXAMPLE_SNIPPETS if ex['title'] == example), None)
@@ -150,28 +181,37 @@ async def roast_code_snippet(
     tts: str = Form(None),
     voice: str = Form(DEFAULT_VOICE)
 ):
+    # Turn requests away while the LLM queue is full, before a credit is spent
+    try:
+        LLM_SCHEDULER.check()
+    except LLMOverloadedError as e:
+        return busy_response(e)
     # Enforce pay-it-forward credit counter
     if not decrement_credits():
         return HTMLResponse(content="<div style='color:red;'>Out of credits. Please add more credits to continue.</div>", status_code=402)
+    request.state.credit_spent = True
     detailed_bool = bool(detailed)
     # include the human-readable description in the roast style
     style_def = next((r for r in ROAST_STYLES if r['name'] == roast_style), None)
     roast_style_full = f"{style_def['name']} ({style_def['description']})" if style_def else roast_style
     # generate roast via utils.llm (uses OpenAI or Ollama under the hood)
-    roast_text = generate_code_roast(
-        code,
-        roast_style_full,
-        detailed=detailed_bool,
-        type="code snippet",
-        model=model,
-        stream=False
-    )
+    with track_usage() as usage:
+        roast_text = await agenerate_code_roast(
+            code,
+            roast_style_full,
+            detailed=detailed_bool,
+            type="code snippet",
+            model=model,
+            stream=False
+        )
     html = f"<pre>{roast_text}</pre>"
     audio_url = None
     if tts:
-        audio_url = generate_tts_audio(roast_text, voice)
+        audio_url = await run_in_threadpool(generate_tts_audio, roast_text, voice)
         html += f"<audio controls autoplay src=\"{audio_url}\"></audio>"
-    clapback_id = insert_clapback(roast_text, audio_url)
+    clapback_id = insert_clapback(
+        roast_text, audio_url, roast_type="code snippet", detailed=detailed_bool, usage=usage.as_dict()
+    )
     share_url = request.url_for("share_clapback", clapback_id=clapback_id)
     html += f"<div><a href=\"{share_url}\" target=\"_blank\">Share this clapback</a></div>"
     return HTMLResponse(content=html)
@@ -187,35 +227,57 @@ async def roast_github_profile(
     tts: str = Form(None),
     voice: str = Form(DEFAULT_VOICE)
 ):
+    # Turn requests away while the LLM queue is full, before a credit is spent;
+    # the critique stage queues as background work, so it has to fit as well
+    try:
+        LLM_SCHEDULER.check()
+        LLM_SCHEDULER.check(BACKGROUND)
+    except LLMOverloadedError as e:
+        return busy_response(e)
     # Enforce pay-it-forward credit counter
     if not decrement_credits():
         return HTMLResponse(content="<div style='color:red;'>Out of credits. Please add more credits to continue.</div>", status_code=402)
+    request.state.credit_spent = True
     detailed_bool = bool(detailed)
-    if not repository:
-        code_dict = parse_full_github_user(profile, depth=1 if detailed_bool else 0)
-    else:
-        code_dict = parse_repo(profile, repository, depth=2 if detailed_bool else 1)
-    summary_dict = critique_code_dict(code_dict)
-    summary_text = "\n".join(f"{k}: {v}" for k, v in summary_dict.items())
-    summary_text += f"\nSummary for the user {profile}:"
-    # include the human-readable description in the roast style
-    style_def = next((r for r in ROAST_STYLES if r['name'] == roast_style), None)
-    roast_style_full = f"{style_def['name']} ({style_def['description']})" if style_def else roast_style
-    # generate roast via utils.llm (uses OpenAI or Ollama under the hood)
-    roast_text = generate_code_roast(
-        summary_text,
-        roast_style_full,
-        detailed=detailed_bool,
-        type="github profile",
-        model=model,
-        stream=False
-    )
+    def parse():
+        with github_priority(DETAILED if detailed_bool else QUICK):
+            if not repository:
+                return parse_full_github_user(profile, depth=1 if detailed_bool else 0)
+            return parse_repo(profile, repository, depth=2 if detailed_bool else 1)
+    # Tokens and time of the critique calls and the roast are stored with the clapback
+    with track_usage() as usage:
+        # Parsing and the critique stage (which downloads the files it reads) are
+        # blocking and run off the event loop
+        try:
+            code_dict = await run_in_threadpool(parse)
+            summary_dict = await run_in_threadpool(critique_code_dict, code_dict, model=model)
+        except GitHubRateLimitError as e:
+            return HTMLResponse(
+                content="<div style='color:red;'>GitHub is rate limiting us right now. Please try again later.</div>",
+                status_code=503,
+                headers={"Retry-After": str(int(e.retry_after) + 1)},
+            )
+        sections = summary_sections(summary_dict, profile)
+        # include the human-readable description in the roast style
+        style_def = next((r for r in ROAST_STYLES if r['name'] == roast_style), None)
+        roast_style_full = f"{style_def['name']} ({style_def['description']})" if style_def else roast_style
+        # generate roast via utils.llm (uses OpenAI or Ollama under the hood)
+        roast_text = await agenerate_code_roast(
+            sections,
+            roast_style_full,
+            detailed=detailed_bool,
+            type="github profile",
+            model=model,
+            stream=False
+        )
     html = f"<pre>{roast_text}</pre>"
     audio_url = None
     if tts:
-        audio_url = generate_tts_audio(roast_text, voice)
+        audio_url = await run_in_threadpool(generate_tts_audio, roast_text, voice)
         html += f"<audio controls autoplay src=\"{audio_url}\"></audio>"
-    clapback_id = insert_clapback(roast_text, audio_url)
+    clapback_id = insert_clapback(
+        roast_text, audio_url, roast_type="github profile", detailed=detailed_bool, usage=usage.as_dict()
+    )
     share_url = request.url_for("share_clapback", clapback_id=clapback_id)
     html += f"<div><a href=\"{share_url}\" target=\"_blank\">Share this clapback</a></div>"
     return HTMLResponse(content=html)
@@ -1,7 +1,11 @@
 import streamlit as st
-from utils.llm import get_model_names, generate_code_roast
+from utils.llm import generate_code_roast
+from utils.model_manager import MODELS
+from utils.llm_scheduler import LLMOverloadedError
 from utils.parser import parse_full_github_user, parse_repo
+from utils.github_scheduler import github_priority, QUICK, DETAILED
 from utils.summarize_git import critique_code_dict
+from utils.prompts import summary_sections
 from config import ROAST_STYLES, EXAMPLE_SNIPPETS, VOICES, DEFAULT_VOICE
 import torch
 
@@ -12,8 +16,10 @@ def init():
     """
     Initialize session state variables for available models and selected model.
     """
-    if 'available_models' not in st.session_state:
-        st.session_state['available_models'] = get_model_names()
+    # Runs once per process; loads the default model(s) in the background
+    MODELS.warm_up()
+    # The list is cached by the model manager, so every rerun sees new models
+    st.session_state['available_models'] = MODELS.names()
     if 'model' not in st.session_state:
         # Default to the first available model
         st.session_state['model'] = st.session_state['available_models'][0]
@@ -41,13 +47,17 @@ def on_click_roast_snippet(code_snippet_fn, roast_style, detailed=False, type="c
     """
     Callback for roast buttons. Generates and displays a code roast.
     """
-    code_snippet = code_snippet_fn(detailed)
-    generator = generate_code_roast(
-        code_snippet, 
-        detailed=detailed, 
-        roast_style=roast_style,
-        type=type
-    )
+    try:
+        code_snippet = code_snippet_fn(detailed)
+        generator = generate_code_roast(
+            code_snippet, 
+            detailed=detailed, 
+            roast_style=roast_style,
+            type=type
+        )
+    except LLMOverloadedError as e:
+        st.error(f"The roaster is busy right now. Please try again in {int(e.retry_after)} seconds.")
+        return
     response_dialog(generator)
 
 def model_selection(container):
@@ -167,10 +177,11 @@ def draw_page():
             st.write(f"Fetching code from GitHub profile: {profile}")
             def code_snippet_fn(detailed=False):
                 def helper():
-                    if not repository:
-                        code_dict = parse_full_github_user(profile, depth=0 if not detailed else 1)
-                    else:
-                        code_dict = parse_repo(profile, repository, depth=1 if not detailed else 2)
+                    with github_priority(DETAILED if detailed else QUICK):
+                        if not repository:
+                            code_dict = parse_full_github_user(profile, depth=0 if not detailed else 1)
+                        else:
+                            code_dict = parse_repo(profile, repository, depth=1 if not detailed else 2)
                     summary = critique_code_dict(code_dict)
                     st.session_state['github_profile'] = profile
                     st.session_state['github_profile_summary'] = summary
@@ -184,9 +195,8 @@ def draw_page():
                     summary = helper()
                 else:
                     summary = st.session_state['github_profile_summary']
-                # dict to string conversion for display
-                code_snippet = "\n".join(f"{k}: {v}" for k, v in summary.items()) + "\nSummary for the user {profile}:".format(profile=profile)
-                return code_snippet
+                # dict to prompt sections, trimmed by priority if the prompt gets too long
+                return summary_sections(summary, profile)
             draw_roast_buttons(code_snippet_fn=code_snippet_fn, key="github profile")
         
 
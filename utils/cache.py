@@ -0,0 +1,168 @@
+"""
+Small persistent key/value cache backed by SQLite.
+Entries carry a JSON metadata dict, are evicted least-recently-used once the
+table grows past max_bytes, and can optionally expire after a TTL.
+
+The size of a table is tracked in memory and recounted every RECOUNT_EVERY
+writes, since other processes may write to the same file. The database uses
+incremental auto-vacuum, so pages freed by eviction are returned to the file
+system instead of letting the file grow to its high-water mark.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from utils.metrics import CACHE_LOOKUPS
+from utils.settings import CACHE_PATH
+
+CacheEntry = namedtuple("CacheEntry", ["value", "meta", "stored_at"])
+
+# Writes between two recounts of the table size
+RECOUNT_EVERY = 500
+
+
+class SqliteCache:
+    def __init__(self, table, path=CACHE_PATH, ttl=None, max_bytes=None):
+        """
+        Args:
+            table (str): Table name; several caches can share one database file.
+            path (str): SQLite database file, created on first use.
+            ttl (float, optional): Seconds after which get() treats an entry as missing.
+            max_bytes (int, optional): Size bound; least recently used entries are evicted first.
+        """
+        self.table = table
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._size = 0
+        self._writes = 0
+
+    def _connect(self):
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            # 2 = INCREMENTAL; files created without it need one VACUUM to switch over
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                " key TEXT PRIMARY KEY, value BLOB NOT NULL, meta TEXT,"
+                " size INTEGER NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed_at)")
+            conn.commit()
+            self._conn = conn
+            self._recount(conn)
+        return self._conn
+
+    def get(self, key, max_age=None):
+        """Return a CacheEntry or None. max_age overrides the cache TTL for this lookup."""
+        max_age = self.ttl if max_age is None else max_age
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                f"SELECT value, meta, stored_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (max_age is not None and now - row[2] > max_age):
+                self.misses += 1
+                CACHE_LOOKUPS.inc(cache=self.table, result="miss")
+                return None
+            conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+        CACHE_LOOKUPS.inc(cache=self.table, result="hit")
+        return CacheEntry(bytes(row[0]), json.loads(row[1] or "{}"), row[2])
+
+    def set(self, key, value, meta=None):
+        """Store bytes under key and evict old entries if the size bound is exceeded."""
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            old = conn.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, meta, size, stored_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, value, json.dumps(meta or {}), len(value), now, now),
+            )
+            self._size += len(value) - (old[0] if old else 0)
+            self._writes += 1
+            if self._writes % RECOUNT_EVERY == 0:
+                self._recount(conn)
+            self._evict(conn)
+            conn.commit()
+
+    def touch(self, key):
+        """Mark an entry as freshly stored, e.g. after a successful revalidation."""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                f"UPDATE {self.table} SET stored_at = ?, accessed_at = ? WHERE key = ?", (now, now, key)
+            )
+            conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            conn = self._connect()
+            old = conn.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            conn.commit()
+            self._size -= old[0] if old else 0
+
+    def clear(self):
+        """Drop all entries and reset the hit/miss counters."""
+        with self._lock:
+            conn = self._connect()
+            conn.execute(f"DELETE FROM {self.table}")
+            conn.commit()
+            conn.execute("PRAGMA incremental_vacuum")
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def _recount(self, conn):
+        self._size = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+
+    def _evict(self, conn):
+        if not self.max_bytes or self._size <= self.max_bytes:
+            return
+        # Another process may have evicted already
+        self._recount(conn)
+        if self._size <= self.max_bytes:
+            return
+        # Drop least recently used entries until we are back under 90% of the bound
+        target = self.max_bytes * 0.9
+        cursor = conn.execute(f"SELECT key, size FROM {self.table} ORDER BY accessed_at")
+        evicted = []
+        for key, size in cursor:
+            if self._size <= target:
+                break
+            evicted.append((key,))
+            self._size -= size
+        cursor.close()
+        conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", evicted)
+        conn.commit()
+        # Hand the freed pages back to the file system
+        conn.execute("PRAGMA incremental_vacuum")
+
+    def stats(self):
+        """Return hit/miss counters of this process plus the stored entry count and size."""
+        with self._lock:
+            conn = self._connect()
+            entries, size = conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
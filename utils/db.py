@@ -2,6 +2,8 @@ import os
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 
+from utils.metrics import Histogram
+
 # Use DATABASE_URL env var or default to localhost Postgres (host=localhost:5031)
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
@@ -12,20 +14,39 @@ DATABASE_URL = os.getenv(
 engine = create_engine(DATABASE_URL, echo=False, future=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Duration of each query function, connection checkout included
+DB_QUERY_SECONDS = Histogram(
+    "roast_db_query_duration_seconds", "Duration of Postgres queries by function", ["query"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+
+# Usage columns of a clapback, filled from utils.usage.RoastUsage.as_dict()
+USAGE_COLUMNS = (
+    "backend", "model", "llm_calls", "prompt_tokens", "completion_tokens", "generation_seconds", "open_api_cost"
+)
 
-def insert_clapback(llm_response: str, audio_url: str = None) -> int:
-    """Insert a new clapback and return its ID."""
+
+@DB_QUERY_SECONDS.time(query="insert_clapback")
+def insert_clapback(llm_response: str, audio_url: str = None, roast_type: str = None, detailed: bool = None,
+                    usage: dict = None) -> int:
+    """Insert a new clapback with its roast type and LLM usage (tokens, time, estimated cost) and return its ID."""
+    usage = usage or {}
+    params = {column: usage.get(column) for column in USAGE_COLUMNS}
     with SessionLocal() as session:
         result = session.execute(
             text(
-                "INSERT INTO roast_my_code.clapback (llm_response, audio_url)"
-                " VALUES (:llm_response, :audio_url) RETURNING id"
+                "INSERT INTO roast_my_code.clapback (llm_response, audio_url, roast_type, detailed, "
+                + ", ".join(USAGE_COLUMNS) + ")"
+                " VALUES (:llm_response, :audio_url, :roast_type, :detailed, "
+                + ", ".join(f":{column}" for column in USAGE_COLUMNS) + ") RETURNING id"
             ),
-            {"llm_response": llm_response, "audio_url": audio_url},
+            {"llm_response": llm_response, "audio_url": audio_url, "roast_type": roast_type, "detailed": detailed, **params},
         )
         session.commit()
         return result.scalar_one()
 
+@DB_QUERY_SECONDS.time(query="get_clapback")
 def get_clapback(clapback_id: int):
     """Retrieve a clapback by ID, returning a dict or None."""
     with engine.connect() as conn:
@@ -39,6 +60,7 @@ def get_clapback(clapback_id: int):
     return dict(row) if row else None
   
 
+@DB_QUERY_SECONDS.time(query="get_remaining_credits")
 def get_remaining_credits() -> int:
     """Get the current number of remaining credits."""
     with engine.connect() as conn:
@@ -47,6 +69,7 @@ def get_remaining_credits() -> int:
         ).scalar_one_or_none()
     return int(result) if result is not None else 0
 
+@DB_QUERY_SECONDS.time(query="increment_credits")
 def increment_credits(amount: int = 1) -> int:
     """Increase credits by the given amount and return new total."""
     with engine.begin() as conn:
@@ -56,6 +79,7 @@ def increment_credits(amount: int = 1) -> int:
         )
     return get_remaining_credits()
 
+@DB_QUERY_SECONDS.time(query="decrement_credits")
 def decrement_credits() -> bool:
     """Attempt to decrement a credit. Returns True if successful, False if none left."""
     with engine.begin() as conn:
@@ -69,10 +93,54 @@ def decrement_credits() -> bool:
         )
         return True
   
+@DB_QUERY_SECONDS.time(query="reset_credits")
 def reset_credits() -> int:
     """Reset the pay-it-forward credits to zero and return new total."""
     with engine.begin() as conn:
         conn.execute(
             text("UPDATE roast_my_code.payitforward_credits SET remaining = 0 WHERE id = 1")
         )
-    return get_remaining_credits()
\ No newline at end of file
+    return get_remaining_credits()
+
+
+@DB_QUERY_SECONDS.time(query="get_usage_by_roast_type")
+def get_usage_by_roast_type(days: int = 30) -> list:
+    """
+    Roasts of the last days grouped by roast type, detail level, backend and model,
+    most expensive on average first.
+
+    Returns:
+        list[dict]: roast_type, detailed, backend, model, roasts, avg_prompt_tokens,
+        avg_completion_tokens, avg_generation_seconds, avg_cost and total_cost.
+    """
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT roast_type, detailed, backend, model, count(*) AS roasts,"
+                " avg(prompt_tokens) AS avg_prompt_tokens, avg(completion_tokens) AS avg_completion_tokens,"
+                " avg(generation_seconds) AS avg_generation_seconds,"
+                " avg(open_api_cost) AS avg_cost, sum(open_api_cost) AS total_cost"
+                " FROM roast_my_code.clapback"
+                " WHERE create_ts >= now() - make_interval(days => :days) AND llm_calls IS NOT NULL"
+                " GROUP BY roast_type, detailed, backend, model"
+                " ORDER BY avg_cost DESC NULLS LAST, avg_generation_seconds DESC NULLS LAST"
+            ),
+            {"days": days},
+        ).mappings().all()
+    return [dict(row) for row in rows]
+
+@DB_QUERY_SECONDS.time(query="get_most_expensive_clapbacks")
+def get_most_expensive_clapbacks(limit: int = 10, days: int = 30) -> list:
+    """The costliest clapbacks of the last days (by estimated cost, then generation time)."""
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT id, roast_type, detailed, backend, model, llm_calls, prompt_tokens, completion_tokens,"
+                " generation_seconds, open_api_cost, create_ts"
+                " FROM roast_my_code.clapback"
+                " WHERE create_ts >= now() - make_interval(days => :days) AND llm_calls IS NOT NULL"
+                " ORDER BY open_api_cost DESC NULLS LAST, generation_seconds DESC NULLS LAST LIMIT :limit"
+            ),
+            {"days": days, "limit": limit},
+        ).mappings().all()
+    return [dict(row) for row in rows]
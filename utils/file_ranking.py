@@ -0,0 +1,136 @@
+"""
+Cheap static ranking of files by roast-worthiness, computed locally before any
+LLM call so the summary budget goes to the worst offenders instead of random files.
+
+Signals (each normalized to 0..1): size, long lines, nesting depth, cyclomatic
+complexity (from `ast` for Python, keyword counts otherwise), duplicate lines,
+TODO density and missing tests. score_metadata() estimates the score from the
+path and size alone, to pick the files whose content is worth reading at all.
+"""
+import ast
+import os
+import re
+
+# Weight of each signal in the final score
+SIGNAL_WEIGHTS = {
+    "size": 1.0,
+    "long_lines": 1.0,
+    "nesting": 1.5,
+    "complexity": 2.0,
+    "duplicates": 1.5,
+    "todos": 1.0,
+    "missing_tests": 1.0,
+}
+
+CODE_EXTENSIONS = ('.py', '.js', '.ts', '.java', '.c', '.cpp', '.sh', '.go', '.rs')
+
+LONG_LINE = 100
+# Average bytes per line, to turn a file size into the line count of the size signal
+BYTES_PER_LINE = 40
+TODO_PATTERN = re.compile(r"\b(TODO|FIXME|XXX|HACK)\b")
+BRANCH_PATTERN = re.compile(r"\b(if|elif|else if|for|while|case|catch|except|and|or)\b|&&|\|\||\?")
+PYTHON_BRANCHES = (
+    ast.If, ast.For, ast.AsyncFor, ast.While, ast.Try, ast.ExceptHandler, ast.With,
+    ast.AsyncWith, ast.BoolOp, ast.IfExp, ast.comprehension, ast.Assert,
+)
+
+
+def is_code_file(path):
+    return path.lower().endswith(CODE_EXTENSIONS)
+
+
+def is_test_file(path):
+    name = os.path.basename(path).lower()
+    return (
+        name.startswith("test_") or name.endswith(("_test.py", "_test.go", ".test.js", ".test.ts", ".spec.js", ".spec.ts"))
+        or any(part in ("test", "tests", "__tests__", "spec") for part in path.lower().split("/")[:-1])
+    )
+
+
+def is_readme(path):
+    return os.path.basename(path).lower().startswith("readme")
+
+
+def _indent_depth(line):
+    expanded = line.expandtabs(4)
+    return (len(expanded) - len(expanded.lstrip(" "))) // 4
+
+
+def _python_complexity(code):
+    """Highest cyclomatic complexity of a function (or the module body), or None if it does not parse."""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+    scopes = [node for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))] or [tree]
+    return max(1 + sum(isinstance(node, PYTHON_BRANCHES) for node in ast.walk(scope)) for scope in scopes)
+
+
+def score_file(path, code, has_tests=True):
+    """
+    Score a file by how much there is to roast.
+
+    Args:
+        path (str): Path of the file within the repository.
+        code (str): File content, or the start of it.
+        has_tests (bool): Whether a test file for it exists in the repository.
+
+    Returns:
+        tuple[float, dict]: Weighted score and the individual signals.
+    """
+    lines = code.splitlines()
+    code_lines = [line for line in lines if line.strip()]
+    count = max(1, len(code_lines))
+    signals = {
+        "size": min(len(code_lines) / 500, 1.0),
+        "long_lines": min(sum(len(line) > LONG_LINE for line in code_lines) / count * 5, 1.0),
+        "todos": min(len(TODO_PATTERN.findall(code)) / count * 20, 1.0),
+    }
+    # Duplicate lines: repeated non-trivial lines (copy-paste)
+    meaningful = [line.strip() for line in code_lines if len(line.strip()) > 10]
+    signals["duplicates"] = 1 - len(set(meaningful)) / len(meaningful) if meaningful else 0.0
+
+    if is_code_file(path):
+        signals["nesting"] = min(max((_indent_depth(line) for line in code_lines), default=0) / 6, 1.0)
+        complexity = _python_complexity(code) if path.endswith(".py") else None
+        if complexity is None:
+            # Per-function complexity is not available; use branch density instead
+            complexity = len(BRANCH_PATTERN.findall(code)) / count * 15
+        signals["complexity"] = min(complexity / 15, 1.0)
+        signals["missing_tests"] = 0.0 if has_tests or is_test_file(path) else 1.0
+    else:
+        signals.update(nesting=0.0, complexity=0.0, missing_tests=0.0)
+
+    score = sum(SIGNAL_WEIGHTS[name] * value for name, value in signals.items())
+    return round(score, 4), signals
+
+
+def score_metadata(path, size, has_tests=True):
+    """
+    Estimate score_file from the path and size alone, before any content is read.
+
+    Large code files tend to nest deeper, branch more and repeat themselves, so
+    those signals are assumed to grow with the size signal.
+    """
+    size_signal = min(size / BYTES_PER_LINE / 500, 1.0)
+    signals = {"size": size_signal}
+    if is_code_file(path):
+        signals.update(nesting=size_signal, complexity=size_signal, duplicates=size_signal)
+        signals["missing_tests"] = 0.0 if has_tests or is_test_file(path) else 1.0
+    return round(sum(SIGNAL_WEIGHTS[name] * value for name, value in signals.items()), 4)
+
+
+def tested_names(paths):
+    """Module names that have a test file among the given paths (test_foo.py -> foo)."""
+    names = set()
+    for path in paths:
+        if is_test_file(path):
+            name = os.path.splitext(os.path.basename(path))[0].lower()
+            for affix in ("test_", "_test", ".test", ".spec"):
+                name = name.replace(affix, "")
+            names.add(name)
+    return names
+
+
+def has_test(path, names):
+    return os.path.splitext(os.path.basename(path))[0].lower() in names
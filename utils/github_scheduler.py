@@ -0,0 +1,190 @@
+"""
+Rate-limit-aware scheduler for GitHub API requests.
+Every request takes a slot from a token bucket, is sent with the token that
+has the most remaining budget, and updates that token's budget from the
+X-RateLimit-* response headers. Secondary rate limits are retried with
+backoff. When the budget runs low, quick roasts keep going while detailed
+roasts wait for the reset.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+QUICK = "quick"
+DETAILED = "detailed"
+
+_priority = contextvars.ContextVar("github_priority", default=QUICK)
+
+
+@contextmanager
+def github_priority(priority):
+    """Run the enclosed GitHub requests with the given priority (QUICK or DETAILED)."""
+    reset_token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(reset_token)
+
+
+class GitHubRateLimitError(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"GitHub rate limit exhausted, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class TokenState:
+    def __init__(self, token):
+        self.token = token
+        # resource ("core", "graphql", ...) -> [remaining, reset epoch]
+        self.budgets = {}
+        self.blocked_until = 0.0
+
+    def remaining(self, resource, now):
+        remaining, reset_at = self.budgets.get(resource, (None, 0))
+        if remaining is None or now >= reset_at:
+            return None
+        return remaining
+
+
+class GitHubScheduler:
+    def __init__(self, session, tokens, rate=20.0, burst=20, reserve=500, max_wait=30.0, max_retries=3):
+        """
+        Args:
+            session (requests.Session): Session used to send the requests.
+            tokens (list[str]): Token pool; an empty list sends unauthenticated requests.
+            rate (float): Sustained requests per second (token bucket refill rate).
+            burst (int): Token bucket capacity.
+            reserve (int): Remaining budget per token kept for quick roasts only.
+            max_wait (float): Longest a request waits for budget before GitHubRateLimitError.
+            max_retries (int): Retries after a rate-limited response.
+        """
+        self.session = session
+        self.tokens = [TokenState(t) for t in tokens] or [TokenState(None)]
+        self.rate = rate
+        self.burst = burst
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self._bucket = float(burst)
+        self._refilled_at = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._bucket = min(self.burst, self._bucket + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _pick_token(self, resource, priority, now):
+        floor = 0 if priority == QUICK else self.reserve
+        best, best_remaining = None, -1
+        for state in self.tokens:
+            if state.blocked_until > now:
+                continue
+            remaining = state.remaining(resource, now)
+            if remaining is not None and remaining <= floor:
+                continue
+            # Unknown budgets count as full so fresh tokens get tried
+            remaining = float("inf") if remaining is None else remaining
+            if remaining > best_remaining:
+                best, best_remaining = state, remaining
+        return best
+
+    def _next_unblock(self, resource, now):
+        candidates = []
+        for state in self.tokens:
+            _, reset_at = state.budgets.get(resource, (None, 0))
+            candidates.append(max(state.blocked_until, reset_at if reset_at > now else 0))
+        return max(min(candidates) - now, 0.0)
+
+    def acquire(self, resource="core", priority=None):
+        """Block until a bucket slot and a token with budget are available and return the token state."""
+        priority = priority or _priority.get()
+        deadline = time.monotonic() + self.max_wait
+        with self._cond:
+            try:
+                while True:
+                    self._refill()
+                    now = time.time()
+                    # Detailed roasts only yield to quick ones once every token is down
+                    # to the reserve (see _pick_token); above it they share the bucket
+                    state = self._pick_token(resource, priority, now)
+                    if state is not None and self._bucket >= 1:
+                        self._bucket -= 1
+                        remaining, reset_at = state.budgets.get(resource, (None, 0))
+                        if remaining is not None:
+                            state.budgets[resource] = [remaining - 1, reset_at]
+                        return state
+                    if state is None:
+                        wait_for = self._next_unblock(resource, now) or 1.0
+                    else:
+                        wait_for = max((1 - self._bucket) / self.rate, 0.01)
+                    if time.monotonic() + wait_for > deadline:
+                        raise GitHubRateLimitError(wait_for)
+                    self._cond.wait(timeout=min(wait_for, 1.0))
+            finally:
+                self._cond.notify_all()
+
+    def record(self, state, response, resource="core"):
+        """Update a token's budget from the response headers and block it if it was rate limited."""
+        headers = response.headers
+        now = time.time()
+        with self._cond:
+            if "X-RateLimit-Remaining" in headers:
+                resource = headers.get("X-RateLimit-Resource", resource)
+                state.budgets[resource] = [
+                    int(headers["X-RateLimit-Remaining"]),
+                    float(headers.get("X-RateLimit-Reset", now + 3600)),
+                ]
+            retry_after = self.retry_after(response)
+            if retry_after is not None:
+                state.blocked_until = max(state.blocked_until, now + retry_after)
+            self._cond.notify_all()
+        return retry_after
+
+    @staticmethod
+    def retry_after(response):
+        """Return the seconds to back off for a rate-limited response, or None if it was not limited."""
+        if response.status_code not in (403, 429):
+            return None
+        headers = response.headers
+        if "Retry-After" in headers:
+            return float(headers["Retry-After"])
+        if headers.get("X-RateLimit-Remaining") == "0":
+            return max(float(headers.get("X-RateLimit-Reset", 0)) - time.time(), 1.0)
+        if "rate limit" in response.text.lower():
+            # Secondary rate limit without a hint: GitHub asks for at least a minute
+            return 60.0
+        return None
+
+    def request(self, method, url, resource="core", **kwargs):
+        """
+        Send a request through the scheduler, rotating tokens and retrying on rate limits.
+        Downloads from raw.githubusercontent.com pass resource="raw": they are not
+        counted against the API budget and their responses carry no rate-limit headers.
+        """
+        headers = dict(kwargs.pop("headers", None) or {})
+        for attempt in range(self.max_retries + 1):
+            state = self.acquire(resource)
+            if state.token:
+                headers["Authorization"] = f"Bearer {state.token}"
+            response = self.session.request(method, url, headers=headers, **kwargs)
+            retry_after = self.record(state, response, resource)
+            if retry_after is None or attempt == self.max_retries:
+                return response
+            response.close()
+            print(f"GitHub rate limit hit on {url}, backing off token for {retry_after:.0f}s")
+        return response
+
+    def status(self):
+        """Return the known remaining budget per token, identified by its position in the pool."""
+        now = time.time()
+        with self._cond:
+            return [
+                {
+                    "token": index,
+                    "blocked_for": max(state.blocked_until - now, 0.0),
+                    "budgets": {r: state.remaining(r, now) for r in state.budgets},
+                }
+                for index, state in enumerate(self.tokens)
+            ]
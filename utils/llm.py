@@ -1,52 +1,290 @@
-import os
-import ollama
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import httpx
 import streamlit as st
-from config import PROMPT_CODE_SNIPPET_TEMPLATE, PROMPT_GITHUB_PROFILE_TEMPLATE
+from config import (
+    SYSTEM_CODE_SNIPPET_TEMPLATE, USER_CODE_SNIPPET_TEMPLATE,
+    SYSTEM_GITHUB_PROFILE_TEMPLATE, USER_GITHUB_PROFILE_TEMPLATE,
+)
+from utils.cache import SqliteCache
+from utils.llm_scheduler import LLMScheduler, QUICK, DETAILED, BACKGROUND
+from utils.metrics import Counter, Gauge, Histogram, STAGE_SECONDS
+from utils.ollama_pool import OllamaPool
+from utils.prompts import PromptSection, build_prompt
+from utils.singleflight import AsyncSingleFlight, SingleFlight
+from utils.usage import OLLAMA, OPENAI, record_usage
+from utils.settings import (
+    OLLAMA_HOSTS, OLLAMA_PROBE_INTERVAL, OLLAMA_PROBE_TIMEOUT, OLLAMA_KEEP_ALIVE, OLLAMA_NUM_CTX, OPENAI_API_KEY, LLM_MAX_CONNECTIONS, LLM_TIMEOUT,
+    LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE,
+    ROAST_CACHE_TTL, ROAST_CACHE_MAX_BYTES, ROAST_CACHE_VARIANTS,
+)
 
+# Model used whenever OPENAI_API_KEY is set
+OPENAI_MODEL = "gpt-4.1-nano"
 
-if "OLLAMA_HOST" in os.environ:
-    ollama.Client(host=os.environ["OLLAMA_HOST"])
+# Every generation waits here for a slot, by priority (see utils.llm_scheduler)
+LLM_SCHEDULER = LLMScheduler(max_concurrency=LLM_MAX_CONCURRENCY * len(OLLAMA_HOSTS), max_queue=LLM_MAX_QUEUE)
 
+# -----------------------------
+# METRICS
+# -----------------------------
+# Calls are timed once they hold a slot; the queue wait before is recorded by the scheduler
+LLM_CALL_SECONDS = Histogram(
+    "roast_llm_call_duration_seconds", "Duration of LLM calls after they got a slot, by priority class", ["priority"]
+)
+LLM_TTFT_SECONDS = Histogram(
+    "roast_llm_time_to_first_token_seconds", "Seconds from sending a streamed LLM call to its first token", ["model"]
+)
+LLM_TOKENS = Counter(
+    "roast_llm_tokens_total", "Tokens processed by the LLM backend by model and kind (prompt or completion)", ["model", "kind"]
+)
+# From Ollama's own eval_count / eval_duration, so prompt evaluation and queueing are not included
+LLM_TOKENS_PER_SECOND = Histogram(
+    "roast_llm_tokens_per_second", "Generation speed of Ollama calls in tokens per second", ["model"],
+    buckets=(1, 2.5, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300),
+)
+# Estimated by utils.prompts before the call, so trimming for the context window shows up here
+ROAST_PROMPT_TOKENS = Histogram(
+    "roast_prompt_tokens", "Estimated tokens of roast prompts (system and user message) by roast type", ["type"],
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000),
+)
+# Per roast type only: section names include repository names
+ROAST_PROMPT_TRIMMED_TOKENS = Counter(
+    "roast_prompt_trimmed_tokens_total", "Tokens cut from roast prompts to fit the context window by roast type", ["type"]
+)
+Gauge("roast_llm_active_calls", "LLM calls holding a slot", collect=lambda: LLM_SCHEDULER.stats()["active"])
+Gauge(
+    "roast_llm_waiting_calls", "LLM calls waiting for a slot by priority class", ["priority"],
+    collect=lambda: {(priority,): c["waiting"] for priority, c in LLM_SCHEDULER.stats()["classes"].items()},
+)
+Gauge(
+    "roast_ollama_host_up", "Whether an Ollama host answered its last call or probe", ["host"],
+    collect=lambda: {} if use_openai() else {(h["host"],): int(h["healthy"]) for h in ollama_pool().stats()},
+)
 
+
+def _record_usage(backend, model, prompt_tokens, completion_tokens, seconds, eval_ns=None):
+    """
+    Count the tokens of a finished call and, given Ollama's eval_duration (ns), its
+    generation speed. The call is also added to the roast's usage (utils.usage).
+    """
+    record_usage(backend, model, prompt_tokens, completion_tokens, seconds)
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, model=model, kind="completion")
+        if eval_ns:
+            LLM_TOKENS_PER_SECOND.observe(completion_tokens / (eval_ns / 1e9), model=model)
+
+
+def _record_ollama_usage(model, response):
+    """Usage of a finished Ollama call, from its response or final stream chunk."""
+    eval_ns = response.get("eval_duration")
+    # Prompt evaluation plus generation: the time the host was busy with the call
+    seconds = ((response.get("prompt_eval_duration") or 0) + (eval_ns or 0)) / 1e9
+    _record_usage(OLLAMA, model, response.get("prompt_eval_count"), response.get("eval_count"), seconds, eval_ns)
+
+
+def _record_openai_usage(resp, seconds):
+    """Usage of a finished OpenAI call; seconds is its wall time."""
+    usage = getattr(resp, "usage", None)
+    if usage is not None:
+        _record_usage(OPENAI, OPENAI_MODEL, usage.prompt_tokens, usage.completion_tokens, seconds)
+
+
+def _observed_stream(stream, model):
+    """Pass a sync stream through, recording its time to first token and, from the final chunk, its usage."""
+    start = time.perf_counter()
+    first = True
+    for chunk in stream:
+        # Ollama chunks are dicts (see _chunk), OpenAI chunks plain text
+        text = chunk["response"] if isinstance(chunk, dict) else chunk
+        if first and text:
+            LLM_TTFT_SECONDS.observe(time.perf_counter() - start, model=model)
+            first = False
+        if isinstance(chunk, dict) and chunk["done"]:
+            _record_ollama_usage(model, chunk)
+        yield chunk
+
+# -----------------------------
+# SHARED CLIENTS
+# -----------------------------
+# One client per backend and flavour for the whole process, each keeping a
+# pool of keep-alive connections, so no request pays for connection setup.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _client(kind, factory):
+    with _clients_lock:
+        if kind not in _clients:
+            _clients[kind] = factory()
+        return _clients[kind]
+
+
+def _limits():
+    return httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+
+
+def ollama_pool():
+    """Shared Ollama clients for all OLLAMA_HOSTS; generate calls are routed through it."""
+    return _client("ollama_pool", lambda: OllamaPool(
+        OLLAMA_HOSTS, LLM_TIMEOUT, _limits(), probe_interval=OLLAMA_PROBE_INTERVAL, probe_timeout=OLLAMA_PROBE_TIMEOUT
+    ))
+
+
+def ollama_client():
+    """Shared synchronous Ollama client for the primary host (the first of OLLAMA_HOSTS)."""
+    return ollama_pool().primary.client
+
+
+def ollama_async_client():
+    """Shared asynchronous Ollama client for the primary host (use from one event loop)."""
+    return ollama_pool().primary.async_client
+
+
+def _openai():
+    try:
+        import openai
+    except ImportError:
+        raise RuntimeError("OPENAI_API_KEY set but openai package not installed")
+    return openai
+
+
+def openai_client():
+    """Shared synchronous OpenAI client."""
+    return _client("openai", lambda: _openai().OpenAI(api_key=OPENAI_API_KEY, timeout=LLM_TIMEOUT))
+
+
+def openai_async_client():
+    """Shared asynchronous OpenAI client (use from one event loop)."""
+    return _client("openai_async", lambda: _openai().AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=LLM_TIMEOUT))
+
+
+def use_openai():
+    return bool(OPENAI_API_KEY)
+
+
+def _ollama_options():
+    # Make the server use the context window prompts are sized for
+    return {"num_ctx": OLLAMA_NUM_CTX} if OLLAMA_NUM_CTX else None
+
+
+def ollama_keep_alive():
+    """OLLAMA_KEEP_ALIVE for requests; plain numbers are seconds (Ollama rejects unitless strings)."""
+    try:
+        return float(OLLAMA_KEEP_ALIVE)
+    except ValueError:
+        return OLLAMA_KEEP_ALIVE or None
+
+
+def _messages(prompt, system=None):
+    # The system message goes first: calls that share it share a prompt prefix,
+    # which Ollama keeps evaluated in its KV cache and OpenAI caches as well
+    return ([{"role": "system", "content": system}] if system else []) + [{"role": "user", "content": prompt}]
+
+
+def _openai_kwargs(prompt, json_mode=False, system=None, stream=False):
+    return {
+        "model": OPENAI_MODEL,
+        "messages": _messages(prompt, system),
+        **({"response_format": {"type": "json_object"}} if json_mode else {}),
+        # Streams end with an extra chunk that has no choices, only the usage of the call
+        **({"stream": True, "stream_options": {"include_usage": True}} if stream else {}),
+    }
+
+
+def _chunk(response):
+    """An Ollama chat stream chunk in the {"response", "done"} chunk format of the sync stream."""
+    chunk = {"response": response.message.content or "", "done": response.done}
+    if response.done:
+        # Token counts and durations (ns) of the finished call
+        for field in ("prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration"):
+            chunk[field] = getattr(response, field, None)
+    return chunk
+
+# -----------------------------
+# SYNC API
+# -----------------------------
 def get_model_names():
     """
-    Retrieve a list of installed model names from Ollama.
+    Retrieve a list of installed model names from Ollama (from all reachable hosts).
 
     Returns:
         list[str]: List of model names.
     """
-    return [model.model for model in ollama.list().get('models', [])]
+    return ollama_pool().model_names()
+
+def resolve_model_name(model=None):
+    """
+    Return the model to use: the given one, or the model selected in the Streamlit session.
+    Resolve it on the calling thread before handing work to other threads, which cannot
+    see the session.
+
+    Returns:
+        str | None: Model name, or None on the OpenAI path (which uses a fixed model).
+    """
+    if model:
+        return model
+    if use_openai():
+        return None
+    model_name = st.session_state.get('model')
+    if not model_name:
+        raise ValueError("No model selected in session state.")
+    return model_name
 
-def get_llm_response(prompt: str, stream=True, model=None):
+def get_llm_response(prompt: str, stream=True, model=None, json_mode=False, priority=QUICK, system=None):
     """
     Generate a response from the selected LLM model using a given prompt.
 
     Args:
-        prompt (str): The prompt to send to the LLM.
+        prompt (str): The prompt to send to the LLM (the user message).
+        json_mode (bool): Constrain the output to a JSON object (the prompt must ask for one).
+        priority (str): Scheduler class of the call (QUICK, DETAILED or BACKGROUND).
+        system (str, optional): System message. Keep it the same across calls that
+            share instructions, so the backend can reuse the evaluated prefix.
 
     Returns:
         generator: A generator yielding response chunks from the LLM.
+
+    Raises:
+        LLMOverloadedError: If too many calls are waiting already.
     """
+    model = resolve_model_name(model)
+    if stream:
+        # Reject right away; the slot itself is taken once the stream is consumed
+        LLM_SCHEDULER.check(priority)
+        return _scheduled_stream(prompt, model, priority, system)
+    with LLM_SCHEDULER.slot(priority), LLM_CALL_SECONDS.time(priority=priority):
+        return _llm_response(prompt, False, model, json_mode, spread=priority == BACKGROUND, system=system)
+
+def _scheduled_stream(prompt, model, priority, system=None):
+    # The slot is held until the stream is exhausted or closed
+    with LLM_SCHEDULER.slot(priority), LLM_CALL_SECONDS.time(priority=priority):
+        stream = _llm_response(prompt, True, model, spread=priority == BACKGROUND, system=system)
+        yield from _observed_stream(stream, OPENAI_MODEL if use_openai() else model)
+
+def _llm_response(prompt, stream, model, json_mode=False, spread=False, system=None):
     # If OpenAI API key is set, use GPT-4.1 nano via OpenAI Python >=1.0.0
-    # If OpenAI API key is set, use GPT-4.1 nano via OpenAI Python >=1.0.0
-    if os.getenv("OPENAI_API_KEY"):
-        try:
-            import openai
-        except ImportError:
-            raise RuntimeError("OPENAI_API_KEY set but openai package not installed")
-        openai.api_key = os.environ["OPENAI_API_KEY"]
+    if use_openai():
+        client = openai_client()
         # Debug: show the outgoing prompt
         print(f"[LLM][OpenAI] Prompt: {prompt}")
         if stream:
-            resp = openai.chat.completions.create(
-                model="gpt-4.1-nano",
-                messages=[{"role": "user", "content": prompt}],
-                stream=True,
-            )
+            start = time.perf_counter()
+            resp = client.chat.completions.create(**_openai_kwargs(prompt, system=system, stream=True))
             # Debug: streaming response object
             print(f"[LLM][OpenAI] Streaming response object: {resp}")
             def event_stream():
                 for chunk in resp:
+                    if not chunk.choices:
+                        _record_openai_usage(chunk, time.perf_counter() - start)
+                        continue
                     choice = chunk.choices[0]
                     delta = getattr(choice, "delta", None)
                     content = getattr(delta, "content", None) if delta is not None else None
@@ -56,10 +294,9 @@ def get_llm_response(prompt: str, stream=True, model=None):
                         yield content
             return event_stream()
         else:
-            resp = openai.chat.completions.create(
-                model="gpt-4.1-nano",
-                messages=[{"role": "user", "content": prompt}],
-            )
+            start = time.perf_counter()
+            resp = client.chat.completions.create(**_openai_kwargs(prompt, json_mode, system))
+            _record_openai_usage(resp, time.perf_counter() - start)
             # Debug: raw full response
             print(f"[LLM][OpenAI] Raw response: {resp}")
             try:
@@ -73,43 +310,306 @@ def get_llm_response(prompt: str, stream=True, model=None):
                 print(f"[LLM][OpenAI] Error parsing response: {e}")
                 return ""
     # Fallback to Ollama if no OpenAI key
-    if model is None:
-        model_name = st.session_state.get('model')
-        if not model_name:
-            raise ValueError("No model selected in session state.")
-    else:
-        model_name = model
-    result = ollama.generate(model=model_name, prompt=prompt, stream=stream)
+    model_name = resolve_model_name(model)
+    # Routed to the best host; background (spread) calls fan out over all hosts
+    chat = lambda client: client.chat(
+        model=model_name,
+        messages=_messages(prompt, system),
+        stream=stream,
+        format="json" if json_mode else None,
+        options=_ollama_options(),
+        keep_alive=ollama_keep_alive(),
+    )
     if stream:
-        return result
+        return (_chunk(response) for response in ollama_pool().stream(model_name, chat, spread=spread))
     else:
-        return result['response']
+        result = ollama_pool().call(model_name, chat, spread=spread)
+        _record_ollama_usage(model_name, result)
+        return result['message']['content']
 
-def generate_code_roast(code: str, roast_style: str, detailed: bool = False, type: str = "code snippet", model=None, stream=True):
+# -----------------------------
+# ASYNC API
+# -----------------------------
+async def aget_model_names():
+    """Async variant of get_model_names."""
+    return await asyncio.to_thread(get_model_names)
+
+async def aget_llm_response(prompt: str, model=None, json_mode=False, priority=QUICK, system=None):
     """
-    Generate a code roast using the LLM based on the provided code and roast style.
+    Async variant of get_llm_response(stream=False). The model has to be given
+    unless OpenAI is used, since there is no Streamlit session to fall back to.
+
+    Returns:
+        str: The full response.
+    """
+    async with LLM_SCHEDULER.aslot(priority):
+        with LLM_CALL_SECONDS.time(priority=priority):
+            return await _allm_response(prompt, model, json_mode, spread=priority == BACKGROUND, system=system)
+
+async def _allm_response(prompt, model, json_mode, spread=False, system=None):
+    if use_openai():
+        start = time.perf_counter()
+        resp = await openai_async_client().chat.completions.create(**_openai_kwargs(prompt, json_mode, system))
+        _record_openai_usage(resp, time.perf_counter() - start)
+        message = resp.choices[0].message if resp.choices else None
+        return (message.content if message is not None else "") or ""
+    if not model:
+        raise ValueError("No model given.")
+    result = await ollama_pool().acall(model, lambda client: client.chat(
+        model=model, messages=_messages(prompt, system), format="json" if json_mode else None,
+        options=_ollama_options(), keep_alive=ollama_keep_alive(),
+    ), spread=spread)
+    _record_ollama_usage(model, result)
+    return result['message']['content']
+
+async def astream_llm_response(prompt: str, model=None, priority=QUICK, system=None):
+    """
+    Async variant of get_llm_response(stream=True). Unlike the sync stream, which
+    yields backend-specific chunks, this yields plain text for both backends.
+    """
+    async with LLM_SCHEDULER.aslot(priority):
+        with LLM_CALL_SECONDS.time(priority=priority):
+            start = time.perf_counter()
+            first = True
+            async for text in _astream_llm_response(prompt, model, spread=priority == BACKGROUND, system=system):
+                if first:
+                    LLM_TTFT_SECONDS.observe(time.perf_counter() - start, model=OPENAI_MODEL if use_openai() else model)
+                    first = False
+                yield text
+
+async def _astream_llm_response(prompt, model, spread=False, system=None):
+    if use_openai():
+        start = time.perf_counter()
+        resp = await openai_async_client().chat.completions.create(**_openai_kwargs(prompt, system=system, stream=True))
+        async for chunk in resp:
+            if not chunk.choices:
+                _record_openai_usage(chunk, time.perf_counter() - start)
+                continue
+            delta = chunk.choices[0].delta
+            if delta is not None and delta.content:
+                yield delta.content
+        return
+    if not model:
+        raise ValueError("No model given.")
+    async for chunk in ollama_pool().astream(model, lambda client: client.chat(
+        model=model, messages=_messages(prompt, system), stream=True,
+        options=_ollama_options(), keep_alive=ollama_keep_alive(),
+    ), spread=spread):
+        if chunk.done:
+            _record_ollama_usage(model, chunk)
+        if chunk['message']['content']:
+            yield chunk['message']['content']
+
+# -----------------------------
+# ROAST CACHE
+# -----------------------------
+# Finished roasts by normalized code, style, detail, type and model. Identical
+# requests (example snippets, pasted-again code, repeat profile roasts) are
+# answered from here; with ROAST_CACHE_VARIANTS > 1 a key collects several
+# roasts first and then serves a random one of them.
+ROAST_CACHE = SqliteCache("roasts", ttl=ROAST_CACHE_TTL, max_bytes=ROAST_CACHE_MAX_BYTES)
+_roast_cache_lock = threading.Lock()
+
+# Identical roasts requested while one is being generated join it instead of
+# starting another generation; streams fan out to every subscriber. The async
+# flight belongs to the event loop of the FastAPI app.
+ROAST_FLIGHT = SingleFlight("roast")
+AROAST_FLIGHT = AsyncSingleFlight("roast")
+
+
+def normalize_code(code):
+    """Code as cache key material: unified line endings, no trailing whitespace or outer blank lines."""
+    if not isinstance(code, str):
+        code = "\n".join(section.text for section in code)
+    lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+def roast_cache_key(code, roast_style, detailed, type, model):
+    digest = hashlib.sha256(normalize_code(code).encode("utf-8")).hexdigest()
+    return f"{type}:{model or OPENAI_MODEL}:{int(bool(detailed))}:{roast_style}:{digest}"
+
+
+def cached_roast(key):
+    """A cached roast for key, or None while the key has fewer than ROAST_CACHE_VARIANTS roasts."""
+    if not ROAST_CACHE_TTL:
+        return None
+    entry = ROAST_CACHE.get(key)
+    variants = json.loads(entry.value) if entry else []
+    if len(variants) < max(1, ROAST_CACHE_VARIANTS):
+        return None
+    return random.choice(variants)
+
+
+def store_roast(key, text):
+    if not ROAST_CACHE_TTL or not text:
+        return
+    with _roast_cache_lock:
+        entry = ROAST_CACHE.get(key)
+        variants = json.loads(entry.value) if entry else []
+        if text not in variants:
+            variants = (variants + [text])[-max(1, ROAST_CACHE_VARIANTS):]
+        ROAST_CACHE.set(key, json.dumps(variants))
+
+
+def _text_pieces(text):
+    # Words with their trailing whitespace, so a replay streams like a generation
+    return re.findall(r"\s*\S+\s*", text) or [text]
+
+
+def _replay(text):
+    """Replay a cached roast as a stream in the chunk format of the active backend."""
+    if use_openai():
+        yield from _text_pieces(text)
+        return
+    for piece in _text_pieces(text):
+        yield {"response": piece, "done": False}
+    yield {"response": "", "done": True}
+
+
+async def _areplay(text):
+    for piece in _text_pieces(text):
+        yield piece
+
+
+def _recording(stream, key):
+    """Pass a roast stream through and cache its text once it completed."""
+    parts = []
+    for chunk in stream:
+        parts.append(chunk if isinstance(chunk, str) else chunk['response'])
+        yield chunk
+    store_roast(key, "".join(parts))
+
+
+async def _arecording(stream, key):
+    parts = []
+    async for chunk in stream:
+        parts.append(chunk)
+        yield chunk
+    store_roast(key, "".join(parts))
+
+def build_roast_prompt(code, roast_style: str, detailed: bool = False, type: str = "code snippet", model=None):
+    """
+    Build the roast prompt so that it fits the model's context window, leaving
+    ROAST_MAX_OUTPUT_TOKENS for the answer. The instructions and style form the
+    system message, which is the same for every roast of a type and style; the
+    code forms the user message.
 
     Args:
-        code (str): The code snippet to roast.
-        roast_style (str): The style of roasting (e.g., humorous, harsh).
-        detailed (bool, optional): Whether to request a detailed roast. Defaults to False.
+        code (str | list[PromptSection]): The code snippet, or prioritized sections
+            (e.g. utils.prompts.summary_sections of a profile summary); the lowest
+            priority sections are trimmed first.
+        model (str, optional): Ollama model; None on the OpenAI path.
 
     Returns:
-        generator: A generator yielding the roast response from the LLM.
+        PromptBuild: The user prompt and system message with their token count and what was trimmed.
     """
-    # Optionally add detail to the prompt if requested
     match type:
         case "code snippet":
-            print("Roasting code snippet...")
-            prompt_template = PROMPT_CODE_SNIPPET_TEMPLATE
+            system_template, prompt_template = SYSTEM_CODE_SNIPPET_TEMPLATE, USER_CODE_SNIPPET_TEMPLATE
         case "github profile":
-            print("Roasting GitHub profile...")
-            prompt_template = PROMPT_GITHUB_PROFILE_TEMPLATE
+            system_template, prompt_template = SYSTEM_GITHUB_PROFILE_TEMPLATE, USER_GITHUB_PROFILE_TEMPLATE
         case _:
             print(f"Unknown type: {type}")
             raise ValueError(f"Unknown type: {type}")
-    prompt = prompt_template.format(
-        code=code,
+    sections = [PromptSection("code", code, 0)] if isinstance(code, str) else code
+    build = build_prompt(
+        prompt_template,
+        sections,
+        # The OpenAI path ignores the model argument
+        model=OPENAI_MODEL if use_openai() else model,
+        system=system_template,
+        # Optionally add detail to the prompt if requested
         roast_style=roast_style + (" (mention specific files)" if detailed else " (use at most 3 sentences)"),
     )
-    return get_llm_response(prompt, stream=stream, model=model)
\ No newline at end of file
+    print(f"[LLM] Prompt: {build.tokens} tokens, {build.reserved} reserved for the answer, "
+          f"context window {build.context_window}"
+          + (f", trimmed {build.trimmed}" if build.trimmed else ""))
+    ROAST_PROMPT_TOKENS.observe(build.tokens, type=type)
+    ROAST_PROMPT_TRIMMED_TOKENS.inc(sum(max(removed, 0) for removed in build.trimmed.values()), type=type)
+    return build
+
+def _roast_priority(detailed):
+    # Quick roasts are the interactive fast path and go first
+    return DETAILED if detailed else QUICK
+
+@STAGE_SECONDS.time(stage="roast_generation")
+def _roast_text(code, roast_style, detailed, type, model, key):
+    build = build_roast_prompt(code, roast_style, detailed=detailed, type=type, model=model)
+    response = get_llm_response(
+        build.prompt, stream=False, model=model, priority=_roast_priority(detailed), system=build.system
+    )
+    store_roast(key, response)
+    return response
+
+def _roast_stream(code, roast_style, detailed, type, model, key):
+    build = build_roast_prompt(code, roast_style, detailed=detailed, type=type, model=model)
+    stream = get_llm_response(
+        build.prompt, stream=True, model=model, priority=_roast_priority(detailed), system=build.system
+    )
+    with STAGE_SECONDS.time(stage="roast_generation"):
+        yield from _recording(stream, key)
+
+def generate_code_roast(code, roast_style: str, detailed: bool = False, type: str = "code snippet", model=None, stream=True):
+    """
+    Generate a code roast using the LLM based on the provided code and roast style.
+
+    Args:
+        code (str | list[PromptSection]): The code snippet to roast, or prioritized sections.
+        roast_style (str): The style of roasting (e.g., humorous, harsh).
+        detailed (bool, optional): Whether to request a detailed roast. Defaults to False.
+
+    Returns:
+        generator: A generator yielding the roast response from the LLM.
+
+    Raises:
+        LLMOverloadedError: If the LLM backend is saturated.
+    """
+    print("Roasting GitHub profile..." if type == "github profile" else "Roasting code snippet...")
+    model = resolve_model_name(model)
+    key = roast_cache_key(code, roast_style, detailed, type, model)
+    cached = cached_roast(key)
+    if cached is not None:
+        print("[LLM] Roast served from cache")
+        return _replay(cached) if stream else cached
+    args = (code, roast_style, detailed, type, model, key)
+    if stream:
+        # Turn the request away now rather than from inside the stream
+        LLM_SCHEDULER.check(_roast_priority(detailed))
+        # The generation runs on a background thread and its chunks are fanned out
+        return ROAST_FLIGHT.stream(("stream", key), _roast_stream, *args)
+    return ROAST_FLIGHT.do(("text", key), _roast_text, *args)
+
+async def _aroast_text(code, roast_style, detailed, type, model, key):
+    build = build_roast_prompt(code, roast_style, detailed=detailed, type=type, model=model)
+    with STAGE_SECONDS.time(stage="roast_generation"):
+        response = await aget_llm_response(
+            build.prompt, model=model, priority=_roast_priority(detailed), system=build.system
+        )
+    store_roast(key, response)
+    return response
+
+async def _aroast_stream(code, roast_style, detailed, type, model, key):
+    build = build_roast_prompt(code, roast_style, detailed=detailed, type=type, model=model)
+    stream = astream_llm_response(build.prompt, model=model, priority=_roast_priority(detailed), system=build.system)
+    with STAGE_SECONDS.time(stage="roast_generation"):
+        async for chunk in _arecording(stream, key):
+            yield chunk
+
+async def agenerate_code_roast(code, roast_style: str, detailed: bool = False, type: str = "code snippet", model=None, stream=True):
+    """
+    Async variant of generate_code_roast for the FastAPI apps.
+
+    Returns:
+        str | async generator: The roast, or an async generator of text chunks if stream is set.
+    """
+    key = roast_cache_key(code, roast_style, detailed, type, model)
+    cached = cached_roast(key)
+    if cached is not None:
+        print("[LLM] Roast served from cache")
+        return _areplay(cached) if stream else cached
+    args = (code, roast_style, detailed, type, model, key)
+    if stream:
+        LLM_SCHEDULER.check(_roast_priority(detailed))
+        return AROAST_FLIGHT.stream(("stream", key), _aroast_stream, *args)
+    return await AROAST_FLIGHT.do(("text", key), _aroast_text, *args)
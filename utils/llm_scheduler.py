@@ -0,0 +1,223 @@
+"""
+Priority scheduler and admission control for LLM calls.
+
+At most max_concurrency calls run against the backend at a time; the others
+wait in one queue ordered by priority class and then arrival:
+
+- QUICK: interactive quick roasts,
+- DETAILED: interactive detailed roasts,
+- BACKGROUND: critique map / reduce calls of the summary stage.
+
+Interactive calls are rejected right away with LLMOverloadedError (and a
+Retry-After estimate) when max_queue calls that would be served before them
+(of their own or a higher class) are already waiting, instead of queueing with
+unbounded latency. Queued background work therefore never turns a quick roast
+away. Background calls belong to a roast that was admitted with check() and are
+never rejected halfway. Queue wait times are recorded per class.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from utils.metrics import Counter, Histogram
+
+QUICK = "quick"
+DETAILED = "detailed"
+BACKGROUND = "background"
+PRIORITIES = (QUICK, DETAILED, BACKGROUND)
+
+# Recent waits kept per class for the percentiles in stats()
+WAIT_SAMPLES = 500
+
+LLM_QUEUE_WAIT_SECONDS = Histogram(
+    "roast_llm_queue_wait_seconds", "Seconds LLM calls waited for a slot by priority class", ["priority"]
+)
+LLM_REJECTED = Counter(
+    "roast_llm_rejected_total", "LLM calls turned away with LLMOverloadedError by priority class", ["priority"]
+)
+
+
+class LLMOverloadedError(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"LLM backend is saturated, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, priority, seq, grant):
+        self.priority = priority
+        self.key = (PRIORITIES.index(priority), seq)
+        self.grant = grant
+        self.granted = False
+        self.enqueued = time.monotonic()
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+
+class _ClassStats:
+    def __init__(self):
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+
+    def record(self, wait):
+        self.admitted += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.waits.append(wait)
+
+    def percentile(self, q):
+        if not self.waits:
+            return 0.0
+        ordered = sorted(self.waits)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency=4, max_queue=32, service_time=5.0):
+        """
+        Args:
+            max_concurrency (int): LLM calls running at a time (match OLLAMA_NUM_PARALLEL).
+            max_queue (int): Waiting calls beyond which interactive calls are rejected (0 = unbounded).
+            service_time (float): Initial estimate of seconds per call, for Retry-After.
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self._service_time = service_time
+        self._active = 0
+        self._queue = []
+        self._seq = itertools.count()
+        self._stats = {priority: _ClassStats() for priority in PRIORITIES}
+        self._lock = threading.Lock()
+
+    def _ahead(self, priority):
+        # Waiters a new call of this class would queue behind
+        rank = PRIORITIES.index(priority)
+        return sum(1 for waiter in self._queue if waiter.key[0] <= rank)
+
+    def _retry_after(self, ahead):
+        # Time until the queue ahead has drained through all slots
+        return max(1.0, math.ceil((ahead + 1) * self._service_time / self.max_concurrency))
+
+    def _reject_if_full(self, priority):
+        ahead = self._ahead(priority)
+        if self.max_queue and ahead >= self.max_queue:
+            self._stats[priority].rejected += 1
+            LLM_REJECTED.inc(priority=priority)
+            raise LLMOverloadedError(self._retry_after(ahead))
+
+    def check(self, priority=QUICK):
+        """
+        Raise LLMOverloadedError if a new job of this class would be rejected right now.
+        For BACKGROUND this admits a whole critique stage, so it counts every waiter.
+        """
+        if priority not in self._stats:
+            raise ValueError(f"Unknown LLM priority: {priority} (expected one of {PRIORITIES})")
+        with self._lock:
+            self._reject_if_full(priority)
+
+    def _enqueue(self, priority, grant):
+        if priority not in self._stats:
+            raise ValueError(f"Unknown LLM priority: {priority} (expected one of {PRIORITIES})")
+        with self._lock:
+            if priority != BACKGROUND:
+                self._reject_if_full(priority)
+            waiter = _Waiter(priority, next(self._seq), grant)
+            heapq.heappush(self._queue, waiter)
+            self._dispatch()
+        return waiter
+
+    def _dispatch(self):
+        # Called with the lock held: hand free slots to the head of the queue
+        while self._active < self.max_concurrency and self._queue:
+            waiter = heapq.heappop(self._queue)
+            waiter.granted = True
+            self._active += 1
+            wait = time.monotonic() - waiter.enqueued
+            self._stats[waiter.priority].record(wait)
+            LLM_QUEUE_WAIT_SECONDS.observe(wait, priority=waiter.priority)
+            waiter.grant()
+
+    def _release(self, started=None):
+        with self._lock:
+            self._active -= 1
+            if started is not None:
+                self._service_time = 0.8 * self._service_time + 0.2 * (time.monotonic() - started)
+            self._dispatch()
+
+    def _abandon(self, waiter):
+        """Take a waiter that gave up out of the queue, or free its slot if it was granted meanwhile."""
+        with self._lock:
+            if not waiter.granted:
+                self._queue.remove(waiter)
+                heapq.heapify(self._queue)
+                return
+        self._release()
+
+    @contextmanager
+    def slot(self, priority=QUICK):
+        """Hold one of the LLM slots for the enclosed call, waiting in the queue for it."""
+        event = threading.Event()
+        waiter = self._enqueue(priority, event.set)
+        try:
+            event.wait()
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(started)
+
+    @asynccontextmanager
+    async def aslot(self, priority=QUICK):
+        """slot() for coroutines; waiting does not block the event loop."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._enqueue(priority, grant)
+        try:
+            await future
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(started)
+
+    def stats(self):
+        """Active and waiting calls, and admitted / rejected counts and queue waits (seconds) per class."""
+        with self._lock:
+            waiting = {priority: 0 for priority in PRIORITIES}
+            for waiter in self._queue:
+                waiting[waiter.priority] += 1
+            return {
+                "active": self._active,
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "classes": {
+                    priority: {
+                        "waiting": waiting[priority],
+                        "admitted": stats.admitted,
+                        "rejected": stats.rejected,
+                        "wait_avg": round(stats.wait_total / stats.admitted, 3) if stats.admitted else 0.0,
+                        "wait_p95": round(stats.percentile(0.95), 3),
+                        "wait_max": round(stats.wait_max, 3),
+                    }
+                    for priority, stats in self._stats.items()
+                },
+            }
@@ -0,0 +1,183 @@
+"""
+Process-wide metrics in the Prometheus text exposition format (version 0.0.4).
+
+Counters, histograms and gauges are declared next to the code they measure and
+register themselves here; render() writes all of them for the /metrics endpoint
+of fastapi_main. Gauges read their values from a callback at render time, so
+existing stats() methods can be exported without extra bookkeeping.
+
+    STAGE_SECONDS = Histogram("roast_stage_duration_seconds", "...", ["stage"])
+
+    with STAGE_SECONDS.time(stage="critique"):
+        ...
+
+    @STAGE_SECONDS.time(stage="tts")
+    def generate_tts_audio(...):
+        ...
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, from a cached lookup to a detailed profile roast
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_REGISTRY = {}
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            if name in _REGISTRY:
+                raise ValueError(f"Metric {name} is already registered")
+            _REGISTRY[name] = self
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.type}"]
+        lines += [f"{name}{labels} {_number(value)}" for name, labels, value in self._samples()]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Counters only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(self.name, _labels(self.labelnames, key), value) for key, value in values]
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        """
+        Args:
+            collect (callable, optional): Returns the current values at render time,
+                as {label values tuple: value} (or a number without labels).
+        """
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        if self.collect is not None:
+            try:
+                values = self.collect()
+            except Exception as e:
+                print(f"[Metrics] Could not collect {self.name}: {e}")
+                return []
+            values = values if isinstance(values, dict) else {(): values}
+            values = sorted((tuple(str(v) for v in key), value) for key, value in values.items())
+        else:
+            with self._lock:
+                values = sorted(self._values.items())
+        return [(self.name, _labels(self.labelnames, key), value) for key, value in values]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # Per label set: [count per bucket (last one +Inf), sum]
+            state = self._values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in the block. Also works as a function decorator."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        samples = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", _labels(self.labelnames, key, [("le", _number(float(bound)))]), cumulative))
+            samples.append((f"{self.name}_sum", _labels(self.labelnames, key), total))
+            samples.append((f"{self.name}_count", _labels(self.labelnames, key), cumulative))
+        return samples
+
+
+def render():
+    """All registered metrics as one Prometheus text exposition."""
+    with _registry_lock:
+        metrics = list(_REGISTRY.values())
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+# -----------------------------
+# SHARED METRICS
+# -----------------------------
+# Wall time of each stage of a roast: github_parse_user / github_parse_repo,
+# critique (with its critique_map and critique_reduce phases), roast_generation and tts
+STAGE_SECONDS = Histogram(
+    "roast_stage_duration_seconds", "Wall time of the stages of a roast in seconds", ["stage"]
+)
+
+# Lookups of the SQLite caches (github_http, github_blobs, critiques, roasts)
+CACHE_LOOKUPS = Counter(
+    "roast_cache_lookups_total", "Lookups of the persistent caches by result (hit or miss)", ["cache", "result"]
+)
@@ -0,0 +1,148 @@
+"""
+Model manager for the Ollama backend.
+
+- The list of installed models is cached: pages and roast requests read it from
+  memory, and once it is older than MODEL_LIST_TTL it is refreshed on a
+  background thread while the old list is still served.
+- warm_up() loads the configured models (OLLAMA_PRELOAD_MODELS, default the first
+  listed model) when the app starts, so the first roast does not pay for loading
+  the model. Every request passes OLLAMA_KEEP_ALIVE, so models in use stay resident.
+- loaded() reports which models are in memory (Ollama's ps).
+
+With several OLLAMA_HOSTS, the list covers all reachable hosts, and models are
+preloaded on every host that has them installed.
+"""
+import asyncio
+import threading
+import time
+
+from utils.llm import get_model_names, ollama_keep_alive, ollama_pool, use_openai
+from utils.settings import MODEL_LIST_TTL, OLLAMA_PRELOAD_MODELS
+
+
+class ModelManager:
+    def __init__(self, ttl=MODEL_LIST_TTL, preload_models=None):
+        """
+        Args:
+            ttl (float): Seconds the model list is served before a background refresh.
+            preload_models (list[str], optional): Models for warm_up (default OLLAMA_PRELOAD_MODELS).
+        """
+        self.ttl = ttl
+        self.preload_models = OLLAMA_PRELOAD_MODELS if preload_models is None else preload_models
+        self._names = None
+        self._fetched_at = 0.0
+        self._refreshing = False
+        self._warmed_up = False
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Fetch the model list now. If Ollama is unreachable, the previous list is kept."""
+        try:
+            names = get_model_names()
+        except Exception as e:
+            with self._lock:
+                self._refreshing = False
+                names = self._names
+            print(f"[Models] Could not list models: {e}")
+            if names is None:
+                raise
+            return list(names)
+        with self._lock:
+            self._names, self._fetched_at, self._refreshing = names, time.monotonic(), False
+        return list(names)
+
+    def names(self):
+        """
+        Installed model names. Only the first call waits for Ollama; later calls
+        get the cached list and trigger a background refresh once it is stale.
+        """
+        with self._lock:
+            names = self._names
+            refresh = (
+                names is not None and not self._refreshing
+                and time.monotonic() - self._fetched_at > self.ttl
+            )
+            if refresh:
+                self._refreshing = True
+        if names is None:
+            return self.refresh()
+        if refresh:
+            threading.Thread(target=self.refresh, name="model-list", daemon=True).start()
+        return list(names)
+
+    async def anames(self):
+        """names() for the FastAPI apps; the first fetch runs off the event loop."""
+        if self._names is None:
+            return await asyncio.to_thread(self.refresh)
+        return self.names()
+
+    def default(self):
+        """The model used when none was chosen: the first listed one, or None if there are none."""
+        names = self.names()
+        return names[0] if names else None
+
+    async def adefault(self):
+        names = await self.anames()
+        return names[0] if names else None
+
+    def preload(self, models=None):
+        """
+        Load models into memory with an empty generate call and pin them for OLLAMA_KEEP_ALIVE.
+
+        Returns:
+            list[str]: The models that were loaded.
+        """
+        if use_openai():
+            return []
+        if models is None:
+            models = self.preload_models or self.names()[:1]
+        loaded = []
+        for model in models:
+            for host in ollama_pool().hosts:
+                start = time.monotonic()
+                try:
+                    host.client.generate(model=model, prompt="", keep_alive=ollama_keep_alive())
+                except Exception as e:
+                    print(f"[Models] Could not preload {model} on {host.url}: {e}")
+                    continue
+                print(f"[Models] Preloaded {model} on {host.url} in {time.monotonic() - start:.1f}s")
+                host.resident.add(model)
+                if model not in loaded:
+                    loaded.append(model)
+        return loaded
+
+    def warm_up(self):
+        """Preload the configured models on a background thread, once per process."""
+        with self._lock:
+            if self._warmed_up:
+                return
+            self._warmed_up = True
+        threading.Thread(target=self.preload, name="model-warm-up", daemon=True).start()
+
+    def loaded(self):
+        """
+        Models currently in memory.
+
+        Returns:
+            list[dict]: host, model, size and size_vram in bytes, and expires_at
+            (ISO time when Ollama unloads it, or None).
+        """
+        if use_openai():
+            return []
+        return [
+            {
+                "host": host,
+                "model": model.model,
+                "size": model.size,
+                "size_vram": model.size_vram,
+                "expires_at": model.expires_at.isoformat() if model.expires_at else None,
+            }
+            for host, model in ollama_pool().loaded()
+        ]
+
+    async def aloaded(self):
+        return await asyncio.to_thread(self.loaded)
+
+
+# Shared by all apps in the process
+MODELS = ModelManager()
@@ -0,0 +1,269 @@
+"""
+Routing of Ollama calls over several hosts (OLLAMA_HOSTS).
+
+A background thread probes every host each OLLAMA_PROBE_INTERVAL seconds for
+its installed (list) and loaded (ps) models. Hosts that fail a probe or a call
+are skipped until they answer a probe again.
+
+Each call goes to a healthy host that has the model installed. Interactive
+calls prefer hosts where the model is already loaded, then the host with the
+fewest calls in flight. Spread calls (the critique stage) go to the least busy
+host first, so background work fans out over all hosts. A call that fails
+before it produced anything is retried on the next host.
+"""
+import itertools
+import threading
+import time
+
+import httpx
+import ollama
+
+
+def _retryable(error):
+    """Whether another host may succeed where this one failed."""
+    if isinstance(error, ollama.ResponseError):
+        # 404: model not installed on this host; 5xx: host in trouble
+        return error.status_code == 404 or error.status_code >= 500
+    return isinstance(error, (ConnectionError, httpx.TransportError))
+
+
+class OllamaHost:
+    def __init__(self, url, timeout, limits, probe_timeout):
+        self.url = url
+        self.client = ollama.Client(host=url, timeout=timeout, limits=limits)
+        self.async_client = ollama.AsyncClient(host=url, timeout=timeout, limits=limits)
+        # Probes use their own client so a dead host cannot hold them up for the full timeout
+        self._probe_client = ollama.Client(host=url, timeout=probe_timeout)
+        # Optimistic until the first probe; None = installed models not known yet
+        self.healthy = True
+        self.installed = None
+        self.resident = set()
+        self.active = 0
+
+    def __repr__(self):
+        return f"OllamaHost({self.url!r}, active={self.active}, healthy={self.healthy})"
+
+    def probe(self):
+        try:
+            installed = {model.model for model in self._probe_client.list().models}
+            resident = {model.model for model in self._probe_client.ps().models}
+        except Exception as e:
+            if self.healthy:
+                print(f"[LLM] Ollama host {self.url} is down: {e}")
+            self.healthy = False
+            return
+        if not self.healthy:
+            print(f"[LLM] Ollama host {self.url} is back")
+        self.healthy, self.installed, self.resident = True, installed, resident
+
+
+class OllamaPool:
+    def __init__(self, urls, timeout, limits, probe_interval=15.0, probe_timeout=5.0):
+        """
+        Args:
+            urls (list[str]): Ollama hosts; the first one is the primary host.
+            timeout (float): Timeout of generate calls in seconds.
+            limits (httpx.Limits): Connection pool limits per host.
+            probe_interval (float): Seconds between health probes (0 disables them).
+            probe_timeout (float): Timeout of a probe in seconds.
+        """
+        self.hosts = [OllamaHost(url, timeout, limits, probe_timeout) for url in urls]
+        self.probe_interval = probe_interval
+        self._rotation = itertools.count()
+        self._prober = None
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self):
+        return self.hosts[0]
+
+    def probe_all(self):
+        for host in self.hosts:
+            host.probe()
+
+    def _probe_loop(self):
+        while True:
+            self.probe_all()
+            time.sleep(self.probe_interval)
+
+    def _start_prober(self):
+        # A single host has nothing to choose from; its errors surface directly
+        if len(self.hosts) < 2 or not self.probe_interval:
+            return
+        with self._lock:
+            if self._prober is not None:
+                return
+            self._prober = threading.Thread(target=self._probe_loop, name="ollama-probe", daemon=True)
+        self._prober.start()
+
+    def pick(self, model, spread=False, exclude=()):
+        """Choose a host for a call to model and count the call as in flight there."""
+        self._start_prober()
+        with self._lock:
+            candidates = [host for host in self.hosts if host not in exclude]
+            # If every host looks down, try them anyway rather than fail without a call
+            candidates = [host for host in candidates if host.healthy] or candidates
+            candidates = [
+                host for host in candidates if host.installed is None or model in host.installed
+            ] or candidates
+            turn = next(self._rotation)
+
+            def score(host):
+                cold = model not in host.resident
+                # Rotate between equal hosts instead of always taking the first
+                tie = (self.hosts.index(host) - turn) % len(self.hosts)
+                return (host.active, cold, tie) if spread else (cold, host.active, tie)
+
+            host = min(candidates, key=score)
+            host.active += 1
+        return host
+
+    def _release(self, host, model, error=None):
+        with self._lock:
+            host.active -= 1
+            if error is None:
+                # The model is loaded there now, and the host is evidently up; without
+                # a prober (single host) this is the only way it is marked healthy again
+                host.resident.add(model)
+                if not host.healthy:
+                    print(f"[LLM] Ollama host {host.url} is back")
+                host.healthy = True
+            elif isinstance(error, ollama.ResponseError) and error.status_code == 404:
+                if host.installed is not None:
+                    host.installed.discard(model)
+            elif _retryable(error):
+                if host.healthy:
+                    print(f"[LLM] Ollama host {host.url} failed: {error}")
+                host.healthy = False
+
+    def _next(self, model, spread, tried, error):
+        """Host to retry on after error, or None if the error should be raised."""
+        if not _retryable(error) or len(tried) >= len(self.hosts):
+            return None
+        host = self.pick(model, spread, tried)
+        print(f"[LLM] Retrying {model} on {host.url}")
+        return host
+
+    def call(self, model, fn, spread=False):
+        """Return fn(client) for the best host's client, failing over to the other hosts."""
+        host, tried = self.pick(model, spread), []
+        while True:
+            try:
+                result = fn(host.client)
+            except Exception as e:
+                self._release(host, model, e)
+                tried.append(host)
+                host = self._next(model, spread, tried, e)
+                if host is None:
+                    raise
+                continue
+            self._release(host, model)
+            return result
+
+    def stream(self, model, fn, spread=False):
+        """
+        Yield from the iterator fn(client). Hosts are switched only until the
+        first chunk arrived; later errors are raised.
+        """
+        host, tried = self.pick(model, spread), []
+        while True:
+            try:
+                chunks = iter(fn(host.client))
+                first = next(chunks, None)
+            except Exception as e:
+                self._release(host, model, e)
+                tried.append(host)
+                host = self._next(model, spread, tried, e)
+                if host is None:
+                    raise
+                continue
+            break
+        error = None
+        try:
+            if first is not None:
+                yield first
+                yield from chunks
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._release(host, model, error)
+
+    async def acall(self, model, fn, spread=False):
+        """call() with the async clients; fn(client) returns an awaitable."""
+        host, tried = self.pick(model, spread), []
+        while True:
+            try:
+                result = await fn(host.async_client)
+            except Exception as e:
+                self._release(host, model, e)
+                tried.append(host)
+                host = self._next(model, spread, tried, e)
+                if host is None:
+                    raise
+                continue
+            self._release(host, model)
+            return result
+
+    async def astream(self, model, fn, spread=False):
+        """stream() with the async clients; fn(client) returns an awaitable of an async iterator."""
+        host, tried = self.pick(model, spread), []
+        while True:
+            try:
+                chunks = aiter(await fn(host.async_client))
+                first = await anext(chunks, None)
+            except Exception as e:
+                self._release(host, model, e)
+                tried.append(host)
+                host = self._next(model, spread, tried, e)
+                if host is None:
+                    raise
+                continue
+            break
+        error = None
+        try:
+            if first is not None:
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._release(host, model, error)
+
+    def model_names(self):
+        """Models installed on any reachable host, in the order the hosts list them."""
+        names, errors = [], []
+        for host in self.hosts:
+            try:
+                response = host.client.list()
+            except Exception as e:
+                errors.append(e)
+                continue
+            names += [model.model for model in response.models if model.model not in names]
+        if len(errors) == len(self.hosts):
+            raise errors[0]
+        return names
+
+    def loaded(self):
+        """(host url, ps model) for the models in memory on every reachable host."""
+        loaded = []
+        for host in self.hosts:
+            try:
+                loaded += [(host.url, model) for model in host.client.ps().models]
+            except Exception as e:
+                print(f"[LLM] Could not ask {host.url} for its loaded models: {e}")
+        return loaded
+
+    def stats(self):
+        with self._lock:
+            return [
+                {
+                    "host": host.url,
+                    "healthy": host.healthy,
+                    "active": host.active,
+                    "resident": sorted(host.resident),
+                }
+                for host in self.hosts
+            ]
@@ -1,22 +1,176 @@
 import requests
 import base64
+import contextvars
+import hashlib
 import json
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
-from utils.settings import GITHUB_TOKEN
+from utils.cache import SqliteCache
+from utils.github_scheduler import GitHubScheduler, GitHubRateLimitError
+from utils.metrics import Counter, STAGE_SECONDS
+from utils.singleflight import SingleFlight, single_flight
+from utils.settings import (
+    GITHUB_TOKENS, GITHUB_MAX_CONCURRENCY, GITHUB_PARSE_MODE, GITHUB_CACHE_TTL,
+    GITHUB_CACHE_MAX_BYTES, BLOB_CACHE_MAX_BYTES, GITHUB_REQUESTS_PER_SECOND, GITHUB_BURST,
+    GITHUB_RATE_LIMIT_RESERVE, GITHUB_MAX_WAIT, PARSE_MAX_FILES, PARSE_MAX_BYTES, PARSE_MAX_SECONDS,
+    GITHUB_API_URL, GITHUB_RAW_URL
+)
 
 # -----------------------------
 # CONFIGURATION
 # -----------------------------
-GITHUB_API_URL = "https://api.github.com"
-# GITHUB_TOKEN is loaded from .env via utils/settings
-if not GITHUB_TOKEN:
+# GITHUB_TOKEN / GITHUB_TOKENS are loaded from .env via utils/settings
+if not GITHUB_TOKENS:
     print("GitHub token not found. Please add GITHUB_TOKEN to your .env file.")
 
+# Authorization is set per request by the scheduler (see SCHEDULER below)
 HEADERS = {
-    "Authorization": f"token {GITHUB_TOKEN}",
     "Accept": "application/vnd.github.v3+json"
 }
 
+# -----------------------------
+# SHARED HTTP SESSION
+# -----------------------------
+# One keep-alive session for all GitHub calls, with a connection pool large
+# enough for the fetch pool below so parallel requests reuse connections.
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=GITHUB_MAX_CONCURRENCY)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+
+# Leaf HTTP requests (directory listings) run on this pool. The global limit on
+# concurrent GitHub requests is GITHUB_SLOTS below, since lazy file reads also
+# come from the critique stage's own thread pools.
+FETCH_POOL = ThreadPoolExecutor(max_workers=GITHUB_MAX_CONCURRENCY, thread_name_prefix="github-fetch")
+
+def submit_fetch(fn, *args):
+    # Run in a copy of the caller's context so the request priority follows the work
+    return FETCH_POOL.submit(contextvars.copy_context().run, fn, *args)
+
+# Every GitHub request goes through the scheduler: it paces requests, rotates
+# across the token pool by remaining budget and backs off on rate limits.
+# Wrap a roast in utils.github_scheduler.github_priority(DETAILED) so quick
+# roasts keep the last part of the budget for themselves.
+SCHEDULER = GitHubScheduler(
+    SESSION,
+    GITHUB_TOKENS,
+    rate=GITHUB_REQUESTS_PER_SECOND,
+    burst=GITHUB_BURST,
+    reserve=GITHUB_RATE_LIMIT_RESERVE,
+    max_wait=GITHUB_MAX_WAIT,
+)
+
+# GitHub requests in flight from all threads (fetch pool, ranking and critique reads)
+GITHUB_SLOTS = threading.BoundedSemaphore(GITHUB_MAX_CONCURRENCY)
+
+def github_request(method, url, **kwargs):
+    """Send a request through SCHEDULER, holding one of the GITHUB_SLOTS while it is sent."""
+    # Streamed bodies are read after the slot is released; there is one archive per repository
+    with GITHUB_SLOTS:
+        return SCHEDULER.request(method, url, **kwargs)
+
+# Requests that actually went out, by API and HTTP status (304 = revalidated
+# cache entry); answers from the caches below are counted as cache lookups
+GITHUB_REQUESTS = Counter(
+    "roast_github_requests_total", "GitHub requests sent by API (rest, graphql or raw) and HTTP status", ["api", "status"]
+)
+
+
+# -----------------------------
+# CONDITIONAL REQUEST CACHE
+# -----------------------------
+# Response bodies are stored with their ETag / Last-Modified validators.
+# Within GITHUB_CACHE_TTL a cached body is served without any request; after
+# that it is revalidated with a conditional request, and a 304 (which GitHub
+# does not count against the rate limit) serves the stored body again.
+HTTP_CACHE = SqliteCache("github_http", ttl=None, max_bytes=GITHUB_CACHE_MAX_BYTES)
+CACHED_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Link")
+
+def _cached_response(url, entry):
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response._content = entry.value
+    response.headers.update(entry.meta.get("headers", {}))
+    response.encoding = "utf-8"
+    return response
+
+def github_get(url, cache=True, **kwargs):
+    # Streamed downloads (archives) are never cached
+    if not cache or kwargs.get("stream"):
+        response = github_request("GET", url, **kwargs)
+        GITHUB_REQUESTS.inc(api="raw" if kwargs.get("resource") == "raw" else "rest", status=response.status_code)
+        return response
+
+    entry = HTTP_CACHE.get(url)
+    if entry and time.time() - entry.stored_at < GITHUB_CACHE_TTL:
+        return _cached_response(url, entry)
+
+    headers = dict(kwargs.pop("headers", None) or {})
+    if entry:
+        validators = entry.meta.get("headers", {})
+        if "ETag" in validators:
+            headers["If-None-Match"] = validators["ETag"]
+        if "Last-Modified" in validators:
+            headers["If-Modified-Since"] = validators["Last-Modified"]
+
+    response = github_request("GET", url, headers=headers, **kwargs)
+    GITHUB_REQUESTS.inc(api="rest", status=response.status_code)
+    if response.status_code == 304 and entry:
+        HTTP_CACHE.touch(url)
+        return _cached_response(url, entry)
+    if response.status_code == 200:
+        kept = {h: response.headers[h] for h in CACHED_HEADERS if h in response.headers}
+        HTTP_CACHE.set(url, response.content, {"headers": kept})
+    return response
+
+# -----------------------------
+# BLOB STORE
+# -----------------------------
+# Decoded file contents keyed by their git blob SHA. A SHA identifies the
+# exact bytes, so entries never go stale: forks, vendored copies, shared
+# LICENSE/README files and repeat roasts are downloaded and decoded once.
+BLOB_STORE = SqliteCache("github_blobs", ttl=None, max_bytes=BLOB_CACHE_MAX_BYTES)
+
+def git_blob_sha(data):
+    """Compute the git blob SHA-1 of raw file bytes (same id GitHub reports as 'sha')."""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+def blob_store_stats():
+    return BLOB_STORE.stats()
+
+def github_graphql(query, variables):
+    """
+    POST a GraphQL query and return the decoded JSON body.
+
+    GraphQL responses carry no validators, so they are only cached for the
+    freshness window, keyed by a hash of the query and its variables.
+    """
+    payload = {"query": query, "variables": variables}
+    key = "graphql:" + hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    entry = HTTP_CACHE.get(key, max_age=GITHUB_CACHE_TTL)
+    if entry:
+        return json.loads(entry.value)
+
+    response = github_request(
+        "POST",
+        f"{GITHUB_API_URL}/graphql",
+        resource="graphql",
+        headers={"Content-Type": "application/json"},
+        json=payload
+    )
+    GITHUB_REQUESTS.inc(api="graphql", status=response.status_code)
+    response.raise_for_status()
+    data = response.json()
+    if not data.get("errors"):
+        HTTP_CACHE.set(key, response.content)
+    return data
+
 # -----------------------------
 # FILE TYPE FILTER
 # -----------------------------
@@ -27,53 +181,671 @@ def is_text_file(file_name):
     )
     return file_name.lower().endswith(text_extensions)
 
+MAX_FILE_SIZE = 1_000_000
+
+def is_wanted_file(file_name, size):
+    return is_text_file(file_name) and size < MAX_FILE_SIZE
+
 # -----------------------------
 # FETCH REPO CONTENTS
 # -----------------------------
 def fetch_repo_contents(owner, repo, path=""):
     url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/contents/{path}"
-    response = requests.get(url, headers=HEADERS)
+    response = github_get(url)
+    response.raise_for_status()
+    return response.json()
+
+def download_blob(url, sha=None):
+    """Download a blob through the API and keep it in the blob store; None if it is not base64."""
+    # Blobs are immutable, so the blob store replaces the HTTP cache here
+    file_data = github_get(url, cache=False).json()
+    if file_data.get('encoding') != 'base64':
+        return None
+    data = base64.b64decode(file_data['content'])
+    if sha:
+        BLOB_STORE.set(sha, data)
+    return data
+
+def fetch_file_content(item):
+    sha = item.get('sha')
+    if sha:
+        entry = BLOB_STORE.get(sha)
+        if entry:
+            return entry.value.decode('utf-8', errors='ignore')
+
+    data = download_blob(item['url'], sha)
+    return None if data is None else data.decode('utf-8', errors='ignore')
+
+def fetch_repo_tree(owner, repo, ref="HEAD"):
+    """Fetch the full recursive git tree of a ref (default branch HEAD) in one call."""
+    url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/git/trees/{ref}?recursive=1"
+    response = github_get(url)
     response.raise_for_status()
     return response.json()
 
+def open_repo_tarball(owner, repo, ref=""):
+    """Open a streaming HTTP response for the repository tarball (default branch if no ref)."""
+    url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/tarball/{ref}".rstrip('/')
+    response = github_get(url, stream=True)
+    response.raise_for_status()
+    response.raw.decode_content = True
+    return response
+
+# -----------------------------
+# PARSE BUDGET
+# -----------------------------
+class BudgetExhausted(Exception):
+    pass
+
+class ParseBudget:
+    """
+    Per-roast limit on files admitted, bytes read and wall time.
+
+    One budget is shared by every repository parsed for a roast. Traversal
+    stops admitting files once it is used up, LazyFile reads past the byte cap
+    raise BudgetExhausted, and everything left out is listed in report().
+    The wall time limit only bounds the traversal: once finish() is called,
+    the critique stage can still read the admitted files.
+    A limit of 0 or None means unlimited.
+    """
+
+    def __init__(self, max_files=PARSE_MAX_FILES, max_bytes=PARSE_MAX_BYTES, max_seconds=PARSE_MAX_SECONDS):
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.started = time.monotonic()
+        self.finished = None
+        self.files = 0
+        self.bytes = 0
+        self.skipped = []
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    def finish(self):
+        """End the traversal; later reads are no longer held to the time limit."""
+        with self._lock:
+            if self.finished is None:
+                self.finished = time.monotonic()
+
+    def _out_of_time(self):
+        return self.max_seconds and self.finished is None and self.elapsed >= self.max_seconds
+
+    def exhausted_reason(self):
+        if self.max_files and self.files >= self.max_files:
+            return "file limit"
+        if self.max_bytes and self.bytes >= self.max_bytes:
+            return "byte limit"
+        if self._out_of_time():
+            return "time limit"
+        return None
+
+    @property
+    def exhausted(self):
+        return self.exhausted_reason() is not None
+
+    def skip(self, path, reason=None):
+        with self._lock:
+            self.skipped.append((path, reason or self.exhausted_reason()))
+
+    def admit_file(self, path, size=0):
+        """
+        Count a file into the roast, or record it as skipped and return False.
+        A known `size` is charged in the same step, so a file that does not fit
+        the byte limit does not take a file slot.
+        """
+        with self._lock:
+            reason = self.exhausted_reason()
+            if not reason and self.max_bytes and self.bytes + size > self.max_bytes:
+                reason = "byte limit"
+            if reason:
+                self.skipped.append((path, reason))
+                return False
+            self.files += 1
+            self.bytes += size
+            return True
+
+    def charge_bytes(self, path, size):
+        """Account for reading `size` bytes; raises BudgetExhausted if that would exceed the cap."""
+        with self._lock:
+            if self.max_bytes and self.bytes + size > self.max_bytes:
+                self.skipped.append((path, "byte limit"))
+                raise BudgetExhausted(f"byte budget of {self.max_bytes} exhausted")
+            if self._out_of_time():
+                self.skipped.append((path, "time limit"))
+                raise BudgetExhausted(f"time budget of {self.max_seconds}s exhausted")
+            self.bytes += size
+
+    def report(self):
+        return {
+            "files": self.files,
+            "bytes": self.bytes,
+            "seconds": round(self.elapsed, 2),
+            "exhausted": self.exhausted_reason(),
+            "skipped": len(self.skipped),
+            "skipped_paths": [path for path, _ in self.skipped[:20]],
+        }
+
+# -----------------------------
+# LAZY FILE HANDLES
+# -----------------------------
+class LazyFile:
+    """
+    A repository file whose content is only downloaded when it is read.
+
+    read(limit) fetches just the first `limit` bytes with an HTTP Range request
+    on the raw download URL, so the critique stage downloads roughly what it
+    sends to the LLM. The handle keeps the longest prefix read so far: shorter
+    reads are served from it, and longer ones only download the missing bytes.
+    Full files and prefixes are also kept in the blob store (prefixes under
+    "<sha>:prefix"). Downloaded bytes are charged to the roast's ParseBudget,
+    if one is attached; blob store hits are free.
+    """
+
+    def __init__(self, name, path, size=0, sha=None, url=None, download_url=None, content=None, budget=None):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.sha = sha
+        self.url = url
+        self.download_url = download_url
+        self._content = content
+        self.budget = budget
+        # Raw bytes from the start of the file; None until the blob store was checked
+        self._prefix = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"LazyFile({self.path!r}, size={self.size})"
+
+    def __str__(self):
+        return self.read()
+
+    @property
+    def loaded(self):
+        return self._content is not None
+
+    def read(self, limit=None):
+        """Return the decoded content, or only its first `limit` characters."""
+        with self._lock:
+            if self._content is not None:
+                return self._content if limit is None else self._content[:limit]
+            # Only bytes actually downloaded are charged; blob store hits are free
+            if limit is None or limit >= self.size or not self.download_url:
+                content = self._stored()
+                if content is None:
+                    if self.budget:
+                        self.budget.charge_bytes(self.path, self.size)
+                    data = download_blob(self.url, self.sha)
+                    content = "" if data is None else data.decode('utf-8', errors='ignore')
+                self._content = content
+                return self._content if limit is None else self._content[:limit]
+            if self._prefix is None:
+                self._content = self._stored()
+                if self._content is not None:
+                    return self._content[:limit]
+                entry = BLOB_STORE.get(f"{self.sha}:prefix") if self.sha else None
+                self._prefix = entry.value if entry else b""
+            if len(self._prefix) < limit:
+                self._extend_prefix(limit)
+                if self._content is not None:
+                    return self._content[:limit]
+            return self._prefix[:limit].decode('utf-8', errors='ignore')[:limit]
+
+    def _stored(self):
+        """The content from the blob store, or None."""
+        entry = BLOB_STORE.get(self.sha) if self.sha else None
+        return entry.value.decode('utf-8', errors='ignore') if entry else None
+
+    def _extend_prefix(self, limit):
+        """Download the bytes missing from the kept prefix up to `limit` and charge only those."""
+        have = len(self._prefix)
+        if self.budget:
+            self.budget.charge_bytes(self.path, limit - have)
+        response = github_get(
+            self.download_url, cache=False, resource="raw", headers={"Range": f"bytes={have}-{limit - 1}"}
+        )
+        response.raise_for_status()
+        if response.status_code == 200:
+            # A server that ignores Range sends the whole file
+            if self.sha:
+                BLOB_STORE.set(self.sha, response.content)
+            self._content = response.content.decode('utf-8', errors='ignore')
+            return
+        self._prefix += response.content
+        if self.sha:
+            BLOB_STORE.set(f"{self.sha}:prefix", self._prefix)
+
+def read_file(value, limit=None):
+    """Read a parsed file value, which is either a LazyFile or an already decoded string."""
+    if isinstance(value, LazyFile):
+        return value.read(limit)
+    return value if limit is None else value[:limit]
+
+def materialize(repo_dict):
+    """Return a copy of a parsed dict with every LazyFile read into a plain string."""
+    return {
+        key: materialize(value) if isinstance(value, dict) else read_file(value)
+        for key, value in repo_dict.items()
+    }
+
 # -----------------------------
 # PARSE A REPOSITORY
 # -----------------------------
-def parse_repo(owner, repo, path="", depth=2):
+PARSE_MODES = ("contents", "tree", "archive")
+
+# Concurrent parses of the same repository or profile share one parse. Calls
+# with their own ParseBudget are not coalesced: the caller wants its report.
+PARSE_FLIGHT = SingleFlight("parse")
+
+@single_flight(PARSE_FLIGHT, lambda owner, repo, path="", depth=2, mode=None, budget=None: None if budget is not None else (
+    "repo", owner.lower(), repo.lower(), path, depth, mode or GITHUB_PARSE_MODE
+))
+@STAGE_SECONDS.time(stage="github_parse_repo")
+def parse_repo(owner, repo, path="", depth=2, mode=None, budget=None):
+    """
+    Parse a repository into a nested dict of {name: LazyFile or sub-dict}.
+
+    budget is the roast's ParseBudget (a fresh one with the configured limits
+    if not given); files beyond it are left out and listed in its report.
+    A budget passed in is not finished here, since other repositories may
+    still be walked on it; call budget.finish() once all of them are parsed.
+
+    mode selects how the file listing is obtained (defaults to GITHUB_PARSE_MODE):
+      - "contents": one contents API call per directory.
+      - "tree": a single recursive git trees API call, filtered locally.
+      - "archive": a single streamed tarball download, filtered in memory.
+    """
+    mode = mode or GITHUB_PARSE_MODE
+    own_budget = budget is None
+    budget = budget or ParseBudget()
+    try:
+        if budget.exhausted:
+            budget.skip(f"{owner}/{repo}/")
+            return {}
+        if mode == "contents":
+            return parse_repo_contents(owner, repo, path, depth, budget)
+        if mode == "tree":
+            return parse_repo_tree(owner, repo, path, depth, budget)
+        if mode == "archive":
+            return parse_repo_archive(owner, repo, path, depth, budget)
+        raise ValueError(f"Unknown parse mode: {mode} (expected one of {PARSE_MODES})")
+    finally:
+        if own_budget:
+            budget.finish()
+
+def parse_repo_contents(owner, repo, path="", depth=2, budget=None):
+    """
+    Walk a repository with the contents API.
+
+    Directory listings are submitted to FETCH_POOL as soon as their parent
+    listing arrives, so sibling subdirectories are listed in parallel. Only
+    this (calling) thread waits on futures; pool workers never block on each
+    other. Files are returned as LazyFile handles and not downloaded here.
+    """
     repo_dict = {}
     if depth < 0:
         return repo_dict
+    budget = budget or ParseBudget()
+
+    pending = {}
+    progress = tqdm(desc=f"Parsing {owner}/{repo}/{path or '.'}", unit="item", total=0)
+
+    def submit_listing(dir_path, target, remaining):
+        if budget.exhausted:
+            budget.skip(f"{owner}/{repo}/{dir_path}/")
+            return
+        future = submit_fetch(fetch_repo_contents, owner, repo, dir_path)
+        pending[future] = (dir_path, target, remaining)
+
+    submit_listing(path, repo_dict, depth)
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            item_path, target, remaining = pending.pop(future)
+            try:
+                items = future.result()
+            except GitHubRateLimitError:
+                # The whole roast has to wait, not just this directory
+                for other in pending:
+                    other.cancel()
+                progress.close()
+                raise
+            except Exception as e:
+                print(f"Failed to fetch {item_path}: {e}")
+                continue
+
+            progress.total += len(items)
+            progress.refresh()
+            for item in items:
+                item_type = item['type']
+                item_size = item.get('size', 0)
+
+                if item_type == 'file' and is_wanted_file(item['name'], item_size):
+                    if budget.admit_file(f"{owner}/{repo}/{item['path']}"):
+                        target[item['name']] = LazyFile(
+                            item['name'], item['path'], item_size, item.get('sha'), item['url'],
+                            item.get('download_url'), budget=budget
+                        )
+                elif item_type == 'dir' and remaining > 0:
+                    target[item['name']] = {}
+                    submit_listing(item['path'], target[item['name']], remaining - 1)
+                progress.update(1)
+
+    progress.close()
+    return repo_dict
+
+def parse_repo_tree(owner, repo, path="", depth=2, budget=None):
+    """
+    Build the repo dict from a single recursive git tree listing.
+
+    The depth limit, text-file filter and size cap are applied locally; files
+    are returned as LazyFile handles, so this is the only request made here.
+    Falls back to the contents walk if GitHub truncates the tree.
+    """
+    repo_dict = {}
+    if depth < 0:
+        return repo_dict
+    budget = budget or ParseBudget()
 
     try:
-        items = fetch_repo_contents(owner, repo, path)
+        tree = fetch_repo_tree(owner, repo)
+    except GitHubRateLimitError:
+        raise
     except Exception as e:
-        print(f"Failed to fetch {path}: {e}")
+        print(f"Failed to fetch tree of {owner}/{repo}: {e}")
         return repo_dict
+    if tree.get('truncated'):
+        print(f"Tree of {owner}/{repo} is truncated, falling back to contents listing")
+        return parse_repo_contents(owner, repo, path, depth, budget)
 
-    for item in tqdm(items, desc=f"Parsing {owner}/{repo}/{path or '.'}", unit="item"):
-        item_path = item['path']
-        item_type = item['type']
-        item_size = item.get('size', 0)
+    prefix = path.strip('/') + '/' if path.strip('/') else ''
+    for entry in tree.get('tree', []):
+        if entry['type'] not in ('blob', 'tree') or not entry['path'].startswith(prefix):
+            continue
+        parts = entry['path'][len(prefix):].split('/')
+        if len(parts) - 1 > depth:
+            continue
+        if entry['type'] == 'tree' and len(parts) - 1 == depth:
+            continue
+        if entry['type'] == 'blob' and not is_wanted_file(parts[-1], entry.get('size', 0)):
+            continue
+
+        target = repo_dict
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        if entry['type'] == 'tree':
+            target.setdefault(parts[-1], {})
+            continue
+        if not budget.admit_file(f"{owner}/{repo}/{entry['path']}"):
+            continue
+        target[parts[-1]] = LazyFile(
+            parts[-1], entry['path'], entry.get('size', 0), entry['sha'], entry['url'],
+            f"{GITHUB_RAW_URL}/{owner}/{repo}/HEAD/{entry['path']}", budget=budget
+        )
+    return repo_dict
+
+def parse_repo_archive(owner, repo, path="", depth=2, budget=None):
+    """
+    Build the repo dict from one streamed tarball of the default branch.
+
+    The archive is decompressed on the fly and only entries passing the depth
+    limit, text-file filter and size cap are kept in memory; nothing touches
+    the disk and no per-file API requests are made.
+    """
+    repo_dict = {}
+    if depth < 0:
+        return repo_dict
+    budget = budget or ParseBudget()
+
+    prefix = path.strip('/') + '/' if path.strip('/') else ''
+    try:
+        response = open_repo_tarball(owner, repo)
+    except GitHubRateLimitError:
+        raise
+    except Exception as e:
+        print(f"Failed to download archive of {owner}/{repo}: {e}")
+        return repo_dict
 
-        if item_type == 'file' and is_text_file(item['name']) and item_size < 1_000_000:
+    with response, tarfile.open(fileobj=response.raw, mode="r|gz") as archive:
+        progress = tqdm(archive, desc=f"Parsing {owner}/{repo}/{path or '.'}", unit="entry")
+        for member in progress:
+            # Entries are stored under a single "<owner>-<repo>-<sha>/" root folder
+            _, _, member_path = member.name.partition('/')
+            if not member_path or not member_path.startswith(prefix):
+                continue
+            parts = member_path[len(prefix):].rstrip('/').split('/')
+            if not parts[-1] or len(parts) - 1 > depth:
+                continue
+            if member.isdir():
+                if len(parts) - 1 < depth:
+                    target = repo_dict
+                    for part in parts:
+                        target = target.setdefault(part, {})
+                continue
+            if not member.isfile() or not is_wanted_file(parts[-1], member.size):
+                continue
+            if budget.exhausted:
+                # Stop streaming; the rest of the archive is never downloaded
+                budget.skip(f"{owner}/{repo}/{member_path} and the rest of the archive")
+                break
+            # Concurrent repositories on the same budget may have taken the last file slot
+            if not budget.admit_file(f"{owner}/{repo}/{member_path}", member.size):
+                continue
             try:
-                file_data = requests.get(item['url'], headers=HEADERS).json()
-                if file_data.get('encoding') == 'base64':
-                    content = base64.b64decode(file_data['content']).decode('utf-8', errors='ignore')
-                    repo_dict[item['name']] = content
+                data = archive.extractfile(member).read()
             except Exception as e:
-                print(f"Error reading {item_path}: {e}")
+                print(f"Error reading {member_path}: {e}")
+                continue
+            # Seed the blob store so later contents/tree parses of this file are free
+            sha = git_blob_sha(data)
+            BLOB_STORE.set(sha, data)
+            target = repo_dict
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = LazyFile(
+                parts[-1], member_path, member.size, sha, content=data.decode('utf-8', errors='ignore')
+            )
+    return repo_dict
 
-        elif item_type == 'dir' and depth > 0:
-            repo_dict[item['name']] = parse_repo(owner, repo, item_path, depth - 1)
+def parse_repos(repos, depth=2, mode=None, budget=None):
+    """
+    Parse several (owner, repo) pairs at once and return their dicts in order.
 
-    return repo_dict
+    Each repository is walked by its own coordinating thread; all of them share
+    FETCH_POOL and GITHUB_SLOTS, so the total number of in-flight requests stays bounded.
+    """
+    if not repos:
+        return []
+    with ThreadPoolExecutor(max_workers=len(repos)) as executor:
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run, parse_repo, owner, repo, depth=depth, mode=mode, budget=budget
+            )
+            for owner, repo in repos
+        ]
+        return [future.result() for future in futures]
+
+# -----------------------------
+# FETCH PROFILE OVERVIEW (GraphQL)
+# -----------------------------
+# One query returns the profile fields, pinned repos, the repo list (by stars,
+# paged), the most recently updated repos and recent contributions, so a full
+# profile roast no longer lists the user's repos twice over REST.
+REPOSITORY_FIELDS = """
+    name
+    description
+    primaryLanguage { name }
+    stargazerCount
+    updatedAt
+    owner { login }
+"""
+
+PROFILE_OVERVIEW_QUERY = """
+query($login: String!) {
+  user(login: $login) {
+    login
+    name
+    bio
+    location
+    websiteUrl
+    email
+    twitterUsername
+    followers { totalCount }
+    following { totalCount }
+    createdAt
+    updatedAt
+    pinnedItems(first: 6, types: REPOSITORY) {
+      nodes { ... on Repository { name owner { login } } }
+    }
+    byStars: repositories(first: 100, ownerAffiliations: OWNER, privacy: PUBLIC,
+                          orderBy: {field: STARGAZERS, direction: DESC}) {
+      totalCount
+      pageInfo { hasNextPage endCursor }
+      nodes { %(fields)s }
+    }
+    recentlyUpdated: repositories(first: 10, ownerAffiliations: OWNER, privacy: PUBLIC,
+                                  orderBy: {field: UPDATED_AT, direction: DESC}) {
+      nodes { %(fields)s }
+    }
+    contributionsCollection {
+      commitContributionsByRepository(maxRepositories: 10) {
+        repository { nameWithOwner }
+        contributions(first: 1) { nodes { occurredAt } }
+      }
+      pullRequestContributions(first: 10, orderBy: {direction: DESC}) {
+        nodes { occurredAt pullRequest { repository { nameWithOwner } } }
+      }
+      issueContributions(first: 10, orderBy: {direction: DESC}) {
+        nodes { occurredAt issue { repository { nameWithOwner } } }
+      }
+    }
+  }
+}
+""" % {"fields": REPOSITORY_FIELDS}
+
+REPOSITORIES_PAGE_QUERY = """
+query($login: String!, $cursor: String) {
+  user(login: $login) {
+    byStars: repositories(first: 100, after: $cursor, ownerAffiliations: OWNER, privacy: PUBLIC,
+                          orderBy: {field: STARGAZERS, direction: DESC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes { %(fields)s }
+    }
+  }
+}
+""" % {"fields": REPOSITORY_FIELDS}
+
+def _graphql_user(query, variables):
+    data = github_graphql(query, variables)
+    user = (data.get("data") or {}).get("user")
+    if user is None:
+        raise ValueError(f"GraphQL query failed: {data.get('errors')}")
+    return user
+
+def _rest_repo(node):
+    # Same field names as the REST /users/{u}/repos items used elsewhere
+    return {
+        "name": node["name"],
+        "owner": {"login": node["owner"]["login"]},
+        "description": node["description"],
+        "language": (node.get("primaryLanguage") or {}).get("name"),
+        "stargazers_count": node["stargazerCount"],
+        "updated_at": node["updatedAt"],
+    }
+
+def fetch_profile_overview(username):
+    """
+    Fetch everything a profile roast needs with one GraphQL query (plus extra
+    pages for users with more than 100 repositories).
+
+    Returns:
+        dict: "profile_data" (same shape as fetch_github_profile), "pinned"
+        [(owner, repo)] and "repos" (REST-shaped repo dicts).
+    """
+    user = _graphql_user(PROFILE_OVERVIEW_QUERY, {"login": username})
+
+    by_stars = user["byStars"]
+    nodes = list(by_stars["nodes"])
+    page_info = by_stars["pageInfo"]
+    while page_info["hasNextPage"]:
+        page = _graphql_user(REPOSITORIES_PAGE_QUERY, {"login": username, "cursor": page_info["endCursor"]})
+        nodes.extend(page["byStars"]["nodes"])
+        page_info = page["byStars"]["pageInfo"]
+    known = {(n["owner"]["login"], n["name"]) for n in nodes}
+    nodes.extend(n for n in user["recentlyUpdated"]["nodes"] if (n["owner"]["login"], n["name"]) not in known)
+    repos = [_rest_repo(n) for n in nodes]
+
+    contributions = user["contributionsCollection"]
+    activity = [
+        {
+            "type": "CommitContribution",
+            "repo": c["repository"]["nameWithOwner"],
+            "created_at": (c["contributions"]["nodes"] or [{}])[0].get("occurredAt"),
+        }
+        for c in contributions["commitContributionsByRepository"]
+    ] + [
+        {
+            "type": "PullRequestContribution",
+            "repo": c["pullRequest"]["repository"]["nameWithOwner"],
+            "created_at": c["occurredAt"],
+        }
+        for c in contributions["pullRequestContributions"]["nodes"]
+    ] + [
+        {
+            "type": "IssueContribution",
+            "repo": c["issue"]["repository"]["nameWithOwner"],
+            "created_at": c["occurredAt"],
+        }
+        for c in contributions["issueContributions"]["nodes"]
+    ]
+    activity.sort(key=lambda a: a["created_at"] or "", reverse=True)
+
+    profile_data = {
+        "profile": {
+            "login": user["login"],
+            "name": user["name"],
+            "bio": user["bio"],
+            "location": user["location"],
+            "blog": user["websiteUrl"],
+            "email": user["email"] or None,
+            "twitter": user["twitterUsername"],
+            "followers": user["followers"]["totalCount"],
+            "following": user["following"]["totalCount"],
+            "public_repos": by_stars["totalCount"],
+            "created_at": user["createdAt"],
+            "updated_at": user["updatedAt"],
+        },
+        "repos": [
+            {
+                "name of listed Repository": r["name"],
+                "description": r["description"],
+                "language": r["language"],
+                "stargazers_count": r["stargazers_count"],
+                "updated_at": r["updated_at"],
+            }
+            for r in repos
+        ],
+        "recent_activity": activity[:10],
+    }
+    pinned = [(n["owner"]["login"], n["name"]) for n in user["pinnedItems"]["nodes"] if n]
+    return {"profile_data": profile_data, "pinned": pinned, "repos": repos}
+
+def fetch_profile_overview_or_none(username):
+    # Only GraphQL failures fall back (no token, HTTP errors, an errors payload);
+    # GitHubRateLimitError would hit the same budget on REST and is raised
+    try:
+        return fetch_profile_overview(username)
+    except (requests.RequestException, ValueError) as e:
+        print(f"GraphQL profile query failed, falling back to REST: {e}")
+        return None
 
 # -----------------------------
 # FETCH PINNED REPOS (GraphQL)
 # -----------------------------
 def fetch_pinned_repos(username):
-    url = f"{GITHUB_API_URL}/graphql"
     query = """
     query($login: String!) {
       user(login: $login) {
@@ -90,17 +862,7 @@ def fetch_pinned_repos(username):
       }
     }
     """
-    response = requests.post(
-        url,
-        headers={
-            "Authorization": f"Bearer {GITHUB_TOKEN}",
-            "Content-Type": "application/json"
-        },
-        json={"query": query, "variables": {"login": username}}
-    )
-
-    response.raise_for_status()
-    data = response.json()
+    data = github_graphql(query, {"login": username})
 
     try:
         pinned_repos = data["data"]["user"]["pinnedItems"]["nodes"]
@@ -112,37 +874,46 @@ def fetch_pinned_repos(username):
 # -----------------------------
 # PARSE PINNED REPOS
 # -----------------------------
-def parse_user_pinned_repos(username, depth=2):
+def parse_user_pinned_repos(username, depth=2, pinned=None, budget=None):
     parsed_results = {}
-    pinned = fetch_pinned_repos(username)
+    if pinned is None:
+        pinned = fetch_pinned_repos(username)
 
     if not pinned:
         print(f"No pinned repos found for {username}")
         return parsed_results, pinned
 
-    for owner, repo in pinned:
-        print(f"\nParsing pinned repo: {owner}/{repo}")
-        parsed_results["pinned repository " + repo] = parse_repo(owner, repo, depth=depth)
+    print(f"\nParsing pinned repos: {', '.join(f'{owner}/{repo}' for owner, repo in pinned)}")
+    for (owner, repo), repo_dict in zip(pinned, parse_repos(pinned, depth=depth, budget=budget)):
+        parsed_results["pinned repository " + repo] = repo_dict
 
     return parsed_results, pinned
 
 # -----------------------------
-# PARSE Most ACTIVE REPOS
+# FETCH USER REPOS (REST)
 # -----------------------------
-def parse_most_active_repos(username, previously_parsed, depth=2):
-    print(f"Fetching most active repos for {username}...")
-    # Gather all public repos
+def fetch_user_repos(username):
     repos = []
     page = 1
     while True:
         url = f"{GITHUB_API_URL}/users/{username}/repos?per_page=100&page={page}"
-        response = requests.get(url, headers=HEADERS)
+        response = github_get(url)
         response.raise_for_status()
         page_data = response.json()
         if not page_data:
             break
         repos.extend(page_data)
         page += 1
+    return repos
+
+# -----------------------------
+# PARSE Most ACTIVE REPOS
+# -----------------------------
+def parse_most_active_repos(username, previously_parsed, depth=2, repos=None, budget=None):
+    print(f"Fetching most active repos for {username}...")
+    # Gather all public repos, unless the caller already has them
+    if repos is None:
+        repos = fetch_user_repos(username)
 
     # Sort by stars and recent update
     sorted_stars = sorted(repos, key=lambda r: r.get('stargazers_count', 0), reverse=True)
@@ -160,11 +931,11 @@ def parse_most_active_repos(username, previously_parsed, depth=2):
 
     # Parse each selected repo
     parsed_results = {}
-    for repo in combined:
-        owner = repo['owner']['login']
-        name = repo['name']
-        print(f"\nParsing most active repo: {owner}/{name}")
-        parsed_results[f"other relevant user's repository {name}"] = parse_repo(owner, name, depth=depth)
+    selected = [(repo['owner']['login'], repo['name']) for repo in combined]
+    if selected:
+        print(f"\nParsing most active repos: {', '.join(f'{owner}/{name}' for owner, name in selected)}")
+    for (owner, name), repo_dict in zip(selected, parse_repos(selected, depth=depth, budget=budget)):
+        parsed_results[f"other relevant user's repository {name}"] = repo_dict
 
     return parsed_results
 
@@ -172,11 +943,17 @@ def parse_most_active_repos(username, previously_parsed, depth=2):
 # FETCH GITHUB PROFILE INFO
 # -----------------------------
 def fetch_github_profile(username):
+    overview = fetch_profile_overview_or_none(username)
+    if overview is not None:
+        return overview["profile_data"]
+    return fetch_github_profile_rest(username)
+
+def fetch_github_profile_rest(username):
     profile_data = {}
 
     # Basic profile info
     user_url = f"{GITHUB_API_URL}/users/{username}"
-    user_res = requests.get(user_url, headers=HEADERS)
+    user_res = github_get(user_url)
     user_res.raise_for_status()
     user_info = user_res.json()
 
@@ -196,17 +973,7 @@ def fetch_github_profile(username):
     }
 
     # List of all public repos
-    repos = []
-    page = 1
-    while True:
-        repos_url = f"{GITHUB_API_URL}/users/{username}/repos?per_page=100&page={page}"
-        repos_res = requests.get(repos_url, headers=HEADERS)
-        repos_res.raise_for_status()
-        page_data = repos_res.json()
-        if not page_data:
-            break
-        repos.extend(page_data)
-        page += 1
+    repos = fetch_user_repos(username)
 
     profile_data["repos"] = [
         {
@@ -221,7 +988,7 @@ def fetch_github_profile(username):
 
     # Public activity (last 10)
     events_url = f"{GITHUB_API_URL}/users/{username}/events/public"
-    events_res = requests.get(events_url, headers=HEADERS)
+    events_res = github_get(events_url)
     profile_data["recent_activity"] = []
     if events_res.status_code == 200:
         events = events_res.json()
@@ -239,13 +1006,45 @@ def fetch_github_profile(username):
 # -----------------------------
 # PARSE FULL USER PROFILE + CODE
 # -----------------------------
-def parse_full_github_user(username, depth=1):
+@single_flight(PARSE_FLIGHT, lambda username, depth=1, budget=None: None if budget is not None else (
+    "user", username.lower(), depth
+))
+@STAGE_SECONDS.time(stage="github_parse_user")
+def parse_full_github_user(username, depth=1, budget=None):
+    """
+    Parse a user's profile plus their pinned and most active repositories.
+
+    All repositories share one ParseBudget (configured limits if not given);
+    pass your own to inspect budget.report() afterwards. Without one, concurrent
+    calls for the same user and depth share a single parse (see PARSE_FLIGHT).
+    """
+    budget = budget or ParseBudget()
     print(f"Fetching profile for: {username}")
-    profile_info = fetch_github_profile(username)
+    # The GraphQL overview feeds both the profile and the repo selection;
+    # without it (e.g. no token) we fall back to the separate REST calls
+    overview = fetch_profile_overview_or_none(username)
+    if overview is not None:
+        profile_info, pinned, repos = overview["profile_data"], overview["pinned"], overview["repos"]
+    else:
+        profile_info, pinned, repos = fetch_github_profile_rest(username), None, None
 
     print(f"\nFetching and parsing pinned repos...")
-    pinned_repos_data, pinned_repositories = parse_user_pinned_repos(username, depth=depth)
-    relevant_repos_data = parse_most_active_repos(username, pinned_repositories, depth=depth)
+    pinned_repos_data, pinned_repositories = parse_user_pinned_repos(
+        username, depth=depth, pinned=pinned, budget=budget
+    )
+    relevant_repos_data = parse_most_active_repos(
+        username, pinned_repositories, depth=depth, repos=repos, budget=budget
+    )
+    # The time limit is for the traversal; the critique stage reads the admitted files afterwards
+    budget.finish()
+
+    report = budget.report()
+    print(f"Parse budget: {report['files']} files in {report['seconds']}s"
+          + (f", {report['exhausted']} reached, {report['skipped']} skipped" if report['skipped'] else ""))
+
+    stats = blob_store_stats()
+    print(f"Blob store: {stats['hits']} hits, {stats['misses']} misses, "
+          f"{stats['entries']} blobs ({stats['bytes'] / 1_000_000:.1f} MB)")
 
     return {
         "profile_info": profile_info,
@@ -259,7 +1058,7 @@ def parse_full_github_user(username, depth=1):
 if __name__ == "__main__":
     github_user = "schillij95"  # Replace with any GitHub username
 
-    full_data = parse_full_github_user(github_user, depth=2)
+    full_data = materialize(parse_full_github_user(github_user, depth=2))
 
     with open(f"{github_user}_full_profile.json", "w", encoding="utf-8") as f:
         json.dump(full_data, f, indent=2)
@@ -0,0 +1,197 @@
+"""
+Token-aware prompt assembly.
+
+Prompts are built from sections with priorities. If the prompt plus the room
+reserved for the answer does not fit the model's context window, the lowest
+priority sections are trimmed (and dropped once too small to be useful) before
+the important ones are touched. Token counts use tiktoken when it is installed
+and the OpenAI backend is in use, and a conservative characters-per-token
+estimate otherwise. The backend is never guessed from the model name: Ollama
+serves models called "gpt-..." too.
+"""
+import math
+import re
+import threading
+from collections import namedtuple
+
+from utils.settings import OLLAMA_NUM_CTX, OPENAI_CONTEXT_WINDOW, ROAST_MAX_OUTPUT_TOKENS
+
+# Ollama's default context window if neither the model nor OLLAMA_NUM_CTX set one
+OLLAMA_DEFAULT_NUM_CTX = 2048
+
+# Code tokenizes denser than prose; err on the safe side without a tokenizer
+CHARS_PER_TOKEN = 3.5
+
+# Sections that end up with fewer tokens than this are dropped instead of trimmed
+MIN_SECTION_TOKENS = 32
+
+TRIM_MARKER = "\n... [trimmed to fit the context window]"
+
+# text: section content; priority: lower is more important
+PromptSection = namedtuple("PromptSection", ["name", "text", "priority"])
+
+# prompt: final text (the user message); tokens: size of prompt and system together;
+# context_window / reserved: model window and room kept for the answer;
+# trimmed: {section name: tokens removed}; system: the system message, if any
+PromptBuild = namedtuple(
+    "PromptBuild", ["prompt", "tokens", "context_window", "reserved", "trimmed", "system"], defaults=(None,)
+)
+
+# Priorities of the sections of a profile summary (see critique_code_dict)
+PROFILE_SECTION_PRIORITY = {
+    "profile_info": 1,
+    "pinned_repos_code": 2,
+    "relevant_repos_code": 3,
+}
+
+_encodings = {}
+_context_windows = {}
+_lock = threading.Lock()
+
+
+def _openai_backend():
+    # Imported here: utils.llm builds its prompts with this module
+    from utils.llm import use_openai
+    return use_openai()
+
+
+def _encoding(model):
+    """tiktoken encoding for the OpenAI model, or None on the Ollama backend."""
+    if not model or not _openai_backend():
+        return None
+    with _lock:
+        if model not in _encodings:
+            try:
+                import tiktoken
+                try:
+                    _encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _encodings[model] = tiktoken.get_encoding("o200k_base")
+            except ImportError:
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def count_tokens(text, model=None):
+    """Number of tokens of text for the given model."""
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def context_window(model):
+    """
+    Context window in tokens that a generate call for model will get.
+
+    On the OpenAI backend it is OPENAI_CONTEXT_WINDOW. For Ollama it is
+    OLLAMA_NUM_CTX if set (and then also sent with every request), else the
+    model's num_ctx parameter, else Ollama's default; never more than the model
+    was trained for.
+    """
+    if _openai_backend():
+        return OPENAI_CONTEXT_WINDOW
+    if model is None:
+        return OLLAMA_NUM_CTX or OLLAMA_DEFAULT_NUM_CTX
+    with _lock:
+        if model in _context_windows:
+            return _context_windows[model]
+    num_ctx, trained = None, None
+    try:
+        # Imported here: utils.llm builds its prompts with this module
+        from utils.llm import ollama_client
+        info = ollama_client().show(model)
+        match = re.search(r"^num_ctx\s+(\d+)", info.parameters or "", re.MULTILINE)
+        num_ctx = int(match.group(1)) if match else None
+        trained = next(
+            (int(v) for k, v in (info.modelinfo or {}).items() if k.endswith(".context_length")), None
+        )
+    except Exception as e:
+        print(f"[LLM] Could not look up the context window of {model}: {e}")
+    window = OLLAMA_NUM_CTX or num_ctx or OLLAMA_DEFAULT_NUM_CTX
+    if trained:
+        window = min(window, trained)
+    with _lock:
+        _context_windows[model] = window
+    return window
+
+
+def _trim(text, tokens, model):
+    """Cut text to roughly the given number of tokens, marking the cut."""
+    if count_tokens(text, model) <= tokens:
+        return text
+    keep = max(0, tokens - count_tokens(TRIM_MARKER, model))
+    cut = int(keep * CHARS_PER_TOKEN)
+    # Without a tokenizer the estimate is exact; with one, shrink until it fits
+    while cut > 0 and count_tokens(text[:cut], model) > keep:
+        cut = int(cut * 0.9)
+    return text[:cut] + TRIM_MARKER
+
+
+def fit_sections(sections, budget, model=None):
+    """
+    Join the sections (in their given order) into at most budget tokens.
+
+    Returns:
+        tuple[str, dict]: The text and {section name: tokens removed}.
+    """
+    sizes = [count_tokens(section.text, model) for section in sections]
+    # The newlines between sections count as well
+    over = sum(sizes) + len(sections) - budget
+    texts = [section.text for section in sections]
+    trimmed = {}
+    for i in sorted(range(len(sections)), key=lambda i: (-sections[i].priority, -i)):
+        if over <= 0:
+            break
+        keep = sizes[i] - over
+        if keep < MIN_SECTION_TOKENS:
+            texts[i] = ""
+            removed = sizes[i]
+        else:
+            texts[i] = _trim(texts[i], keep, model)
+            removed = sizes[i] - count_tokens(texts[i], model)
+        trimmed[sections[i].name] = removed
+        over -= removed
+    return "\n".join(text for text in texts if text), trimmed
+
+
+def build_prompt(template, sections, model=None, reserve=None, system=None, **fields):
+    """
+    Fill template with the fitted sections as {code} and the other fields.
+
+    Args:
+        template (str): Prompt template with a {code} placeholder.
+        sections (list[PromptSection]): Content for {code}, in display order.
+        model (str, optional): Model the prompt is for.
+        reserve (int, optional): Tokens kept free for the answer (default ROAST_MAX_OUTPUT_TOKENS).
+        system (str, optional): System message template, filled with the same fields;
+            it is never trimmed and its tokens count against the window.
+
+    Returns:
+        PromptBuild
+    """
+    window = context_window(model)
+    # Small windows keep at least half for the prompt
+    reserve = min(ROAST_MAX_OUTPUT_TOKENS if reserve is None else reserve, window // 2)
+    system = system.format(**fields) if system is not None else None
+    system_tokens = count_tokens(system, model) if system else 0
+    frame = template.format(code="", **fields)
+    budget = max(0, window - reserve - system_tokens - count_tokens(frame, model))
+    code, trimmed = fit_sections(sections, budget, model)
+    prompt = template.format(code=code, **fields)
+    return PromptBuild(prompt, count_tokens(prompt, model) + system_tokens, window, reserve, trimmed, system)
+
+
+def summary_sections(summary, profile=None):
+    """
+    Turn a critique summary dict into prompt sections: one "key: value" line per
+    entry, profile info before pinned before other repositories.
+    """
+    sections = [
+        PromptSection(str(key), f"{key}: {value}", PROFILE_SECTION_PRIORITY.get(key, len(PROFILE_SECTION_PRIORITY) + 1))
+        for key, value in summary.items()
+    ]
+    sections.sort(key=lambda section: section.priority)
+    if profile:
+        sections.append(PromptSection("footer", f"Summary for the user {profile}:", 0))
+    return sections
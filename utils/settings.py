@@ -8,8 +8,114 @@ import os
 # Load variables from .env (must be at project root)
 load_dotenv()
 
+# GitHub endpoints (overridable to point the parser at a local stand-in, see benchmarks/)
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+GITHUB_RAW_URL = os.getenv("GITHUB_RAW_URL", "https://raw.githubusercontent.com")
+
 # GitHub token for authenticating to GitHub API
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN", "")
 
+# Optional comma-separated pool of GitHub tokens; requests rotate across them
+# by remaining rate-limit budget. Falls back to GITHUB_TOKEN.
+GITHUB_TOKENS = [t.strip() for t in (os.getenv("GITHUB_TOKENS") or GITHUB_TOKEN).split(",") if t.strip()]
+
+# Request pacing (token bucket) for all GitHub API calls
+GITHUB_REQUESTS_PER_SECOND = float(os.getenv("GITHUB_REQUESTS_PER_SECOND", "20"))
+GITHUB_BURST = int(os.getenv("GITHUB_BURST", "20"))
+
+# Remaining budget per token below which only quick roasts may use it
+GITHUB_RATE_LIMIT_RESERVE = int(os.getenv("GITHUB_RATE_LIMIT_RESERVE", "500"))
+
+# Longest a GitHub request waits for rate-limit budget before giving up (seconds)
+GITHUB_MAX_WAIT = float(os.getenv("GITHUB_MAX_WAIT", "30"))
+
+# Maximum number of concurrent GitHub API requests made by the parser
+GITHUB_MAX_CONCURRENCY = int(os.getenv("GITHUB_MAX_CONCURRENCY", "8"))
+
+# How the parser lists repository files: "contents" (one call per directory),
+# "tree" (one recursive git trees call per repository) or "archive" (one
+# streamed tarball per repository)
+GITHUB_PARSE_MODE = os.getenv("GITHUB_PARSE_MODE", "contents")
+
+# Local SQLite file used for persistent caches (GitHub responses etc.)
+CACHE_PATH = os.getenv("CACHE_PATH", ".cache/roast_my_code.sqlite3")
+
+# Seconds a cached GitHub response is served without revalidation; after that
+# it is revalidated with a conditional (ETag / Last-Modified) request
+GITHUB_CACHE_TTL = float(os.getenv("GITHUB_CACHE_TTL", "300"))
+
+# Size bound of the GitHub response cache; least recently used entries are evicted
+GITHUB_CACHE_MAX_BYTES = int(os.getenv("GITHUB_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Size bound of the content-addressed store of file contents (keyed by git blob SHA)
+BLOB_CACHE_MAX_BYTES = int(os.getenv("BLOB_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Per-roast parse budget: files admitted, bytes read and wall time (0 = unlimited)
+PARSE_MAX_FILES = int(os.getenv("PARSE_MAX_FILES", "300"))
+PARSE_MAX_BYTES = int(os.getenv("PARSE_MAX_BYTES", str(5 * 1024 * 1024)))
+PARSE_MAX_SECONDS = float(os.getenv("PARSE_MAX_SECONDS", "60"))
+
+# Maximum number of concurrent LLM calls while critiquing the files of a roast
+CRITIQUE_MAX_WORKERS = int(os.getenv("CRITIQUE_MAX_WORKERS", "4"))
+
+# Files critiqued together in one LLM call (1 = one call per file)
+CRITIQUE_BATCH_SIZE = int(os.getenv("CRITIQUE_BATCH_SIZE", "4"))
+
+# Hierarchical summary of a roast: tokens of code sent to the LLM in total,
+# tokens per critiqued chunk, size above which critiques are merged by the LLM,
+# and the smallest share a file gets (fewer files are covered below that)
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "16000"))
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "1500"))
+SUMMARY_REDUCE_TOKENS = int(os.getenv("SUMMARY_REDUCE_TOKENS", "600"))
+SUMMARY_MIN_FILE_TOKENS = int(os.getenv("SUMMARY_MIN_FILE_TOKENS", "128"))
+
+# Number of files sent to the LLM per roast, picked by static ranking (READMEs always included)
+SUMMARY_TOP_K = int(os.getenv("SUMMARY_TOP_K", "40"))
+
+# Cached critiques: lifetime in seconds and size bound of the cache table
+CRITIQUE_CACHE_TTL = float(os.getenv("CRITIQUE_CACHE_TTL", str(7 * 24 * 3600)))
+CRITIQUE_CACHE_MAX_BYTES = int(os.getenv("CRITIQUE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Ollama server, and the connection pool and timeout (seconds) of the shared LLM clients
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+# Several Ollama servers to balance over (comma-separated, default OLLAMA_HOST), and
+# seconds between / timeout of their health probes
+OLLAMA_HOSTS = [h.strip() for h in os.getenv("OLLAMA_HOSTS", "").split(",") if h.strip()] or [OLLAMA_HOST]
+OLLAMA_PROBE_INTERVAL = float(os.getenv("OLLAMA_PROBE_INTERVAL", "15"))
+OLLAMA_PROBE_TIMEOUT = float(os.getenv("OLLAMA_PROBE_TIMEOUT", "5"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "16"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "300"))
+
+# LLM calls running at a time per Ollama host (match OLLAMA_NUM_PARALLEL), and waiting calls beyond
+# which new roasts are turned away with a Retry-After (0 = unbounded queue)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+
+# Context window for Ollama requests (0 = the model's num_ctx or Ollama's default),
+# of the OpenAI model, and tokens kept free for the roast itself
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "0"))
+OPENAI_CONTEXT_WINDOW = int(os.getenv("OPENAI_CONTEXT_WINDOW", "1047576"))
+ROAST_MAX_OUTPUT_TOKENS = int(os.getenv("ROAST_MAX_OUTPUT_TOKENS", "1024"))
+
+# Cache of finished roasts for identical requests: lifetime in seconds (0 disables it),
+# size bound, and how many different roasts are collected per request before reusing them
+ROAST_CACHE_TTL = float(os.getenv("ROAST_CACHE_TTL", str(24 * 3600)))
+ROAST_CACHE_MAX_BYTES = int(os.getenv("ROAST_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+ROAST_CACHE_VARIANTS = int(os.getenv("ROAST_CACHE_VARIANTS", "1"))
+
+# Seconds the cached Ollama model list is served before it is refreshed in the background
+MODEL_LIST_TTL = float(os.getenv("MODEL_LIST_TTL", "60"))
+
+# How long Ollama keeps a model in memory after a request ("30m", seconds, or -1 for
+# forever), and comma-separated models loaded at startup (default: the first listed model)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_PRELOAD_MODELS = [m.strip() for m in os.getenv("OLLAMA_PRELOAD_MODELS", "").split(",") if m.strip()]
+
+# Cost estimates stored with every clapback: OpenAI prices in USD per million prompt and
+# completion tokens (default gpt-4.1-nano), and USD per hour of Ollama generation time
+OPENAI_PROMPT_COST_PER_MTOK = float(os.getenv("OPENAI_PROMPT_COST_PER_MTOK", "0.10"))
+OPENAI_COMPLETION_COST_PER_MTOK = float(os.getenv("OPENAI_COMPLETION_COST_PER_MTOK", "0.40"))
+OLLAMA_COST_PER_HOUR = float(os.getenv("OLLAMA_COST_PER_HOUR", "0"))
+
 # OpenAI API key for OpenAI Python client (if used)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
\ No newline at end of file
@@ -0,0 +1,230 @@
+"""
+Request coalescing ("single flight") for expensive work.
+
+When several callers ask for the same thing at the same time (a viral profile
+roast), only the first one does the work; the others wait for it and share its
+result or error. Streams are fanned out: the work runs once in the background
+and every subscriber receives all chunks from the start, including subscribers
+that join while the stream is already running.
+
+SingleFlight is for threads (Streamlit, FastAPI's threadpool); AsyncSingleFlight
+is for coroutines on one event loop. Nothing is kept once a call finished; the
+caches in utils.cache are responsible for that.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Broadcast:
+    """Chunks of one running stream, readable from the start by any number of subscribers."""
+
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.cond = threading.Condition()
+
+    def subscribe(self):
+        i = 0
+        while True:
+            with self.cond:
+                while i >= len(self.chunks) and not self.finished:
+                    self.cond.wait()
+                if i < len(self.chunks):
+                    chunk = self.chunks[i]
+                    i += 1
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            yield chunk
+
+
+class SingleFlight:
+    def __init__(self, name):
+        """
+        Args:
+            name (str): Name used in stats and logs.
+        """
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """Return fn(*args, **kwargs), shared with concurrent calls for the same key."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            print(f"[{self.name}] Joining in-flight call for {key}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stream(self, key, fn, *args, **kwargs):
+        """
+        Return a generator over the chunks of fn(*args, **kwargs), an iterable that
+        is consumed only once per key while it runs. fn runs on a background thread
+        in a copy of the caller's context.
+        """
+        with self._lock:
+            broadcast = self._streams.get(key)
+            if broadcast is None:
+                broadcast = self._streams[key] = _Broadcast()
+                self.calls += 1
+                context = contextvars.copy_context()
+                threading.Thread(
+                    target=context.run, args=(self._pump, key, broadcast, fn, args, kwargs),
+                    name=f"{self.name}-stream", daemon=True,
+                ).start()
+            else:
+                self.coalesced += 1
+                print(f"[{self.name}] Joining in-flight stream for {key}")
+        return broadcast.subscribe()
+
+    def _pump(self, key, broadcast, fn, args, kwargs):
+        try:
+            for chunk in fn(*args, **kwargs):
+                with broadcast.cond:
+                    broadcast.chunks.append(chunk)
+                    broadcast.cond.notify_all()
+        except BaseException as e:
+            broadcast.error = e
+        finally:
+            with self._lock:
+                del self._streams[key]
+            with broadcast.cond:
+                broadcast.finished = True
+                broadcast.cond.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._streams),
+            }
+
+
+class _AsyncBroadcast:
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.changed = asyncio.Event()
+
+    def publish(self):
+        # Wake everyone waiting and arm the event for the next chunk
+        event, self.changed = self.changed, asyncio.Event()
+        event.set()
+
+    async def subscribe(self):
+        i = 0
+        while True:
+            if i < len(self.chunks):
+                i += 1
+                yield self.chunks[i - 1]
+            elif self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                await self.changed.wait()
+
+
+class AsyncSingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._tasks = {}
+        self._streams = {}
+        # The event loop only keeps weak references to tasks, so the pumps are kept here
+        self._pumps = set()
+
+    async def do(self, key, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs), shared with concurrent calls for the same key."""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+            print(f"[{self.name}] Joining in-flight call for {key}")
+        # A cancelled caller must not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def stream(self, key, fn, *args, **kwargs):
+        """Return an async generator over the chunks of the async iterable fn(*args, **kwargs), shared per key."""
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = self._streams[key] = _AsyncBroadcast()
+            self.calls += 1
+            pump = asyncio.ensure_future(self._pump(key, broadcast, fn, args, kwargs))
+            self._pumps.add(pump)
+            pump.add_done_callback(self._pumps.discard)
+        else:
+            self.coalesced += 1
+            print(f"[{self.name}] Joining in-flight stream for {key}")
+        return broadcast.subscribe()
+
+    async def _pump(self, key, broadcast, fn, args, kwargs):
+        try:
+            async for chunk in fn(*args, **kwargs):
+                broadcast.chunks.append(chunk)
+                broadcast.publish()
+        except BaseException as e:
+            broadcast.error = e
+        finally:
+            self._streams.pop(key, None)
+            broadcast.finished = True
+            broadcast.publish()
+
+    def stats(self):
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._tasks) + len(self._streams)}
+
+
+def single_flight(flight, key):
+    """
+    Decorator that coalesces concurrent calls of a function through flight.
+    key(*args, **kwargs) returns the coalescing key, or None to call through.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            k = key(*args, **kwargs)
+            if k is None:
+                return fn(*args, **kwargs)
+            return flight.do(k, fn, *args, **kwargs)
+        return wrapper
+    return decorate
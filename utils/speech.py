@@ -7,9 +7,11 @@ import soundfile as sf
 import streamlit as st
 import re
 from time import sleep, time
+from utils.metrics import STAGE_SECONDS
 
 pipeline = KPipeline(lang_code='a')
 
+@STAGE_SECONDS.time(stage="tts")
 def text_to_speech(text, data_path='.'):
     """
     Convert text to speech using the specified voice and save audio files.
@@ -85,6 +87,7 @@ def cleanup_prompt(text):
     text.replace('*', '')
     return text
  
+@STAGE_SECONDS.time(stage="tts")
 def generate_tts_audio(text: str, voice: str, out_dir: str = 'tts') -> str:
     """
     Generate TTS audio using OpenAI TTS if available, otherwise fallback to local pipeline.
@@ -1,11 +1,27 @@
-import ollama
+import contextvars
+import hashlib
+import json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any
-from .llm import get_llm_response
-from .parser import is_text_file
+from .llm import get_llm_response, resolve_model_name, LLM_SCHEDULER
+from .llm_scheduler import BACKGROUND
+from .parser import is_text_file, LazyFile, read_file, BudgetExhausted
+from .github_scheduler import GitHubRateLimitError
+from .file_ranking import score_file, score_metadata, tested_names, has_test, is_readme
+from .cache import SqliteCache
+from .metrics import STAGE_SECONDS
+from .singleflight import SingleFlight
+from .settings import (
+    CRITIQUE_MAX_WORKERS, CRITIQUE_BATCH_SIZE, CRITIQUE_CACHE_TTL, CRITIQUE_CACHE_MAX_BYTES,
+    SUMMARY_TOKEN_BUDGET, SUMMARY_CHUNK_TOKENS, SUMMARY_REDUCE_TOKENS, SUMMARY_MIN_FILE_TOKENS,
+    SUMMARY_TOP_K, GITHUB_MAX_CONCURRENCY,
+)
 from tqdm import tqdm
 
-# A default prompt to critique code – customize as needed
-PROMPT_CODE_SNIPPET_TEMPLATE = """
+# Reviewer instructions, sent as the system message of every critique call: the
+# map calls of a roast all start with this prefix, so the backend evaluates it once
+CRITIQUE_SYSTEM_PROMPT = """
 You are a critical code reviewer. Review the following code/README and point out only what is wrong, flawed, or could be improved. Be on point but keep it short and concise. Do not include any positive feedback or compliments.
 
 Focus on:
@@ -18,46 +34,491 @@ Focus on:
 - Anything usefull for a humoristic roast of the repository
 
 Avoid saying anything positive. Be brutally honest.
+"""
 
+# A default prompt to critique code – customize as needed
+PROMPT_CODE_SNIPPET_TEMPLATE = """
 Code: {code}
 Critique:
 """
 
-def critique_code_dict(code_dict: Dict[str, Any]) -> Dict[str, Any]:
+# Several files at once, answered as JSON
+PROMPT_BATCH_TEMPLATE = """Review every file below on its own.
+Answer with a JSON object that maps each file name to its critique, like {{"{example}": "critique"}}, and nothing else.
+
+Files:
+{files}
+"""
+
+# System message and prompt to merge the critiques of the parts of a directory or file into one
+REDUCE_SYSTEM_PROMPT = """
+You are a critical code reviewer. You merge critiques of the parts of a file or directory into one short critique of it.
+Keep the most damning points and the file names they refer to, drop repetitions. Do not include any positive feedback or compliments.
+"""
+
+PROMPT_REDUCE_TEMPLATE = """
+Critiques of the parts of {path}:
+{critiques}
+Merged critique of {path}:
+"""
+
+# Changes whenever a summary prompt changes, which invalidates all cached critiques
+PROMPT_VERSION = hashlib.sha256("\0".join([
+    CRITIQUE_SYSTEM_PROMPT, PROMPT_CODE_SNIPPET_TEMPLATE, PROMPT_BATCH_TEMPLATE,
+    REDUCE_SYSTEM_PROMPT, PROMPT_REDUCE_TEMPLATE,
+]).encode()).hexdigest()[:16]
+
+# Chunk critiques and merged summaries keyed by model, prompt version and
+# content, so re-roasts and popular profiles skip the LLM for unchanged code
+CRITIQUE_CACHE = SqliteCache("critiques", ttl=CRITIQUE_CACHE_TTL, max_bytes=CRITIQUE_CACHE_MAX_BYTES)
+
+# Characters of every candidate read for the static ranking; also the smallest
+# prefix read for its critique, so both share one download
+RANK_PREFIX_CHARS = SUMMARY_CHUNK_TOKENS * 4
+
+# Files pre-ranked by path and size whose content is read for the static ranking
+RANK_CANDIDATES = 2 * SUMMARY_TOP_K
+
+
+def critique_cache_key(model, content_hash):
+    return f"{model or 'openai'}:{PROMPT_VERSION}:{content_hash}"
+
+
+def estimate_tokens(text):
+    """Rough token count of a text (about 4 characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def _cached_llm(prompt, model, json_mode=False, system=CRITIQUE_SYSTEM_PROMPT, parse=None):
     """
-    Recursively critiques code in a nested dict where file contents are strings.
-    Replaces each file's content with the LLM's critique.
+    LLM call through the critique cache, keyed by the prompt and system message.
+    With `parse`, the parsed answer is returned, and an answer it turns into None
+    is returned as None without being cached.
     """
-    result = {}
+    parse = parse or (lambda answer: answer)
+    key = critique_cache_key(model, hashlib.sha256(f"{system}\0{prompt}".encode("utf-8")).hexdigest())
+    cached = CRITIQUE_CACHE.get(key)
+    if cached:
+        result = parse(cached.value.decode("utf-8"))
+        if result is not None:
+            return result
+    summary = get_llm_response(
+        prompt, stream=False, model=model, json_mode=json_mode, priority=BACKGROUND, system=system
+    )
+    result = parse(summary) if summary else summary
+    # Errors and unparseable answers are not cached, only real critiques
+    if summary and result is not None:
+        CRITIQUE_CACHE.set(key, summary, meta={"model": model})
+    return result
+
+# -----------------------------
+# COLLECT AND BUDGET FILES
+# -----------------------------
+def _has_text_files(code_dict):
+    return any(
+        _has_text_files(value) if isinstance(value, dict) else is_text_file(key)
+        for key, value in code_dict.items()
+    )
 
-    items = code_dict.items()
-    # random shuffle the items to ensure different order each time
-    items = list(items)  # Convert to list for tqdm compatibility
-    from random import shuffle
-    shuffle(items)
-    # only use first 10 items for performance
-    count = 0
-    for key, value in tqdm(items, desc="Critiquing code", unit="file"):
-        if isinstance(value, str) and is_text_file(key):
-            if not value.endswith('.md'):
-                if count >= 3:
-                    # Limit to first 10 files for performance
-                    result[key] = "Critique skipped for performance reasons."
-                    continue
-                count += 1
-            max_length = min(1000, len(value))  # Limit to first 10,000 characters for performance
-            code = value[:max_length]
-            # This is a file
-            prompt = PROMPT_CODE_SNIPPET_TEMPLATE.format(code=code)
-            try:
-                summary = get_llm_response(prompt, stream=False)
-                result[key] = summary
-            except Exception as e:
-                result[key] = f"Error during LLM evaluation: {e}"
+
+def _stringify(code_dict):
+    return {key: _stringify(value) if isinstance(value, dict) else str(value) for key, value in code_dict.items()}
+
+
+def _collect(code_dict, path, result, keep_levels, files, dirs, slots, root=None):
+    """
+    Walk the nested dict in sorted order and record what has to be summarized.
+
+    The first keep_levels levels are mirrored into result. A folder at the last
+    kept level is a roll-up root: everything below it becomes one summary. Files
+    at kept levels get a summary of their own.
+
+    Args:
+        files (list): (path, value, group) of every file; group is the folder the
+            file is packed with, or the file itself at kept levels.
+        dirs (dict): Folder path -> child folder paths, for folders below roll-up roots.
+        slots (list): (result dict, key, path) to fill with the summary of path.
+    """
+    for key in sorted(code_dict, key=str):
+        value = code_dict[key]
+        item_path = path + (key,)
+        if isinstance(value, (str, LazyFile)) and is_text_file(key):
+            if root is None:
+                files.append((item_path, value, item_path))
+                slots.append((result, key, item_path))
+            else:
+                files.append((item_path, value, path))
         elif isinstance(value, dict):
-            # This is a folder
-            result[key] = critique_code_dict(value)
-        else:
+            if root is not None:
+                dirs[path].append(item_path)
+                dirs[item_path] = []
+                _collect(value, item_path, None, keep_levels, files, dirs, slots, root)
+            elif len(item_path) < keep_levels:
+                result[key] = {}
+                _collect(value, item_path, result[key], keep_levels, files, dirs, slots)
+            elif _has_text_files(value):
+                dirs[item_path] = []
+                slots.append((result, key, item_path))
+                _collect(value, item_path, None, keep_levels, files, dirs, slots, root=item_path)
+            else:
+                # Profile data and other non-code folders are passed on as they are
+                result[key] = _stringify(value)
+        elif root is None:
             result[key] = str(value)  # Handle other types gracefully
 
-    return result
\ No newline at end of file
+
+def _file_tokens(value):
+    return max(1, (_file_size(value) + 3) // 4)
+
+
+def _file_size(value):
+    return value.size if isinstance(value, LazyFile) else len(value)
+
+
+def rank_files(files, max_workers, candidates=None):
+    """
+    Score files with utils.file_ranking from the start of their content
+    (RANK_PREFIX_CHARS, which is later reused for their critique).
+
+    Only READMEs, files already in memory and the `candidates` files (default
+    RANK_CANDIDATES) with the best score_metadata are read; the others are left
+    out, so a large repository costs a bounded number of downloads. Returns
+    {path: score}; files that cannot be read are left out too. GitHubRateLimitError
+    is raised: without the files the roast cannot go on.
+    """
+    candidates = RANK_CANDIDATES if candidates is None else candidates
+    names = tested_names("/".join(path) for path, _, _ in files)
+    free, lazy = [], []
+    for item in files:
+        path, value, _ = item
+        unread = isinstance(value, LazyFile) and not value.loaded and not is_readme(path[-1])
+        (lazy if unread else free).append(item)
+    lazy.sort(key=lambda f: (-score_metadata("/".join(f[0]), _file_size(f[1]), has_test(f[0][-1], names)), f[0]))
+    files = free + lazy[:candidates]
+
+    def score(path, value):
+        try:
+            code = read_file(value, RANK_PREFIX_CHARS)
+        except GitHubRateLimitError:
+            raise
+        except Exception:
+            return None
+        return score_file("/".join(path), code, has_tests=has_test(path[-1], names))[0]
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rank") as pool:
+        futures = {
+            path: pool.submit(contextvars.copy_context().run, score, path, value) for path, value, _ in files
+        }
+    scores = {path: future.result() for path, future in futures.items()}
+    return {path: value for path, value in scores.items() if value is not None}
+
+
+def allocate_tokens(files, token_budget, scores=None, top_k=None, min_file_tokens=None):
+    """
+    Split the token budget over files and return {path: tokens}.
+
+    READMEs come first, then files by descending score (see rank_files), then
+    closer to the top of the tree. Only the first top_k files are admitted, and
+    fewer if the budget cannot give each of them min_file_tokens. The admitted
+    files share the budget evenly, and small files hand what they do not need
+    to the bigger ones.
+    """
+    min_file_tokens = min_file_tokens or SUMMARY_MIN_FILE_TOKENS
+    top_k = SUMMARY_TOP_K if top_k is None else top_k
+    if scores is not None:
+        files = [f for f in files if f[0] in scores]
+    ordered = sorted(files, key=lambda f: (
+        not is_readme(f[0][-1]), -(scores or {}).get(f[0], 0), len(f[0]), f[0]
+    ))
+    admitted = ordered[:max(0, min(top_k, token_budget // max(1, min_file_tokens)))]
+    allocation = {}
+    remaining = token_budget
+    by_size = sorted(admitted, key=lambda f: (_file_tokens(f[1]), f[0]))
+    for i, (path, value, _) in enumerate(by_size):
+        tokens = min(_file_tokens(value), remaining // (len(by_size) - i))
+        allocation[path] = tokens
+        remaining -= tokens
+    return allocation
+
+# -----------------------------
+# MAP: CRITIQUE CHUNKS
+# -----------------------------
+def _build_chunks(files, allocation, chunk_tokens, batch_size):
+    """
+    Pack the budgeted part of each file into chunks of at most chunk_tokens and
+    batch_size files. Files are only packed together with files of the same
+    group (folder), and files larger than a chunk are split into several parts.
+
+    Returns:
+        list: (group, pieces), where a piece is (path, value, start, end, part, parts)
+            in characters of the file's budgeted prefix.
+    """
+    chunk_chars = chunk_tokens * 4
+    chunks = []
+    current = {}
+    for path, value, group in files:
+        if path not in allocation:
+            continue
+        chars = allocation[path] * 4
+        if chars > chunk_chars:
+            parts = -(-chars // chunk_chars)
+            for part in range(parts):
+                start = part * chunk_chars
+                piece = (path, value, start, min(chars, start + chunk_chars), part + 1, parts)
+                chunks.append((group, [piece]))
+            continue
+        pieces, used = current.get(group, (None, 0))
+        if pieces is None or used + chars > chunk_chars or len(pieces) >= batch_size:
+            pieces, used = [], 0
+            chunks.append((group, pieces))
+        pieces.append((path, value, 0, chars, 1, 1))
+        current[group] = (pieces, used + chars)
+    return chunks
+
+
+def parse_batch_critiques(text, names):
+    """
+    Parse the LLM answer to a batch prompt into {name: critique}. Tolerates code
+    fences, text around the JSON object, nested values and file names given
+    without their folder. Returns None unless every name got a critique.
+    """
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    by_key = {str(key).strip().lower(): value for key, value in data.items()}
+    critiques = {}
+    for name in names:
+        value = by_key.get(name.lower(), by_key.get(name.rsplit("/", 1)[-1].lower()))
+        if value is None or value == "":
+            return None
+        critiques[name] = value if isinstance(value, str) else json.dumps(value)
+    return critiques
+
+
+def _critique_batch(sections, model):
+    """
+    Critique several files with one prompt that asks for a JSON object of
+    {file name: critique}. If the answer cannot be parsed, the batch is split in
+    halves and retried, down to single files with the plain critique prompt.
+
+    Args:
+        sections (list): (name, text) of every file in the batch.
+    """
+    if len(sections) == 1:
+        name, text = sections[0]
+        return {name: _cached_llm(PROMPT_CODE_SNIPPET_TEMPLATE.format(code=text), model)}
+    prompt = PROMPT_BATCH_TEMPLATE.format(
+        example=sections[0][0], files="\n\n".join(text for _, text in sections)
+    )
+    names = [name for name, _ in sections]
+    critiques = _cached_llm(prompt, model, json_mode=True, parse=lambda answer: parse_batch_critiques(answer, names))
+    if critiques is None:
+        print(f"Batch critique of {len(sections)} files could not be parsed, splitting it")
+        half = len(sections) // 2
+        critiques = {**_critique_batch(sections[:half], model), **_critique_batch(sections[half:], model)}
+    return critiques
+
+
+def _critique_chunk(pieces, allocation, model):
+    """Read the pieces of one chunk and return their critique. Errors end up in the critique text."""
+    # Files from the parser carry their git blob SHA, so a cached critique
+    # can be found without downloading anything
+    content_id = None
+    if all(getattr(value, "sha", None) for _, value, *_ in pieces):
+        content_id = "chunk:" + hashlib.sha256("\n".join(
+            f"{'/'.join(path)}:{value.sha}:{start}:{end}" for path, value, start, end, _, _ in pieces
+        ).encode()).hexdigest()
+        cached = CRITIQUE_CACHE.get(critique_cache_key(model, content_id))
+        if cached:
+            return cached.value.decode("utf-8")
+
+    sections = []
+    notes = []
+    for path, value, start, end, part, parts in pieces:
+        name = "/".join(path)
+        # Parts read at least the ranking prefix; a lazy file serves shorter reads from
+        # the prefix it keeps and downloads only the bytes beyond it
+        try:
+            code = read_file(value, max(allocation[path] * 4, RANK_PREFIX_CHARS))[start:end]
+        except BudgetExhausted:
+            notes.append(f"{name}: skipped, roast budget exhausted.")
+            continue
+        except GitHubRateLimitError:
+            raise
+        except Exception as e:
+            notes.append(f"{name}: error reading file: {e}")
+            continue
+        label = f"### {name}" + (f" (part {part}/{parts})" if parts > 1 else "")
+        sections.append((name, f"{label}\n{code}"))
+    if not sections:
+        return "\n".join(notes)
+
+    try:
+        if len(sections) == 1:
+            critique = _cached_llm(PROMPT_CODE_SNIPPET_TEMPLATE.format(code=sections[0][1]), model)
+        else:
+            critique = "\n".join(f"{name}: {text}" for name, text in _critique_batch(sections, model).items())
+    except Exception as e:
+        return "\n".join([f"Error during LLM evaluation: {e}"] + notes)
+    if content_id and not notes:
+        CRITIQUE_CACHE.set(critique_cache_key(model, content_id), critique, meta={"model": model})
+    return "\n".join([critique] + notes)
+
+# -----------------------------
+# REDUCE: ROLL UP SUMMARIES
+# -----------------------------
+def _reduce(path, items, model, reduce_tokens):
+    """Merge critiques of the parts of path; short ones are just concatenated."""
+    items = [item for item in items if item]
+    text = "\n\n".join(items)
+    if len(items) <= 1 or estimate_tokens(text) <= reduce_tokens:
+        return text
+    prompt = PROMPT_REDUCE_TEMPLATE.format(path="/".join(path), critiques=text)
+    try:
+        return _cached_llm(prompt, model, system=REDUCE_SYSTEM_PROMPT)
+    except Exception as e:
+        return f"Error during LLM evaluation: {e}\n{text}"
+
+
+# Concurrent critiques of the same content with the same model and budget share one run
+CRITIQUE_FLIGHT = SingleFlight("critique")
+
+
+def code_dict_fingerprint(code_dict):
+    """Hash of the paths and contents of a nested code dict; lazy files count by blob SHA and are not downloaded."""
+    digest = hashlib.sha256()
+
+    def walk(node, path):
+        for key in sorted(node, key=str):
+            value = node[key]
+            if isinstance(value, dict):
+                walk(value, path + (str(key),))
+                continue
+            if isinstance(value, LazyFile):
+                ident = value.sha or f"{value.download_url}:{value.size}"
+            else:
+                ident = hashlib.sha256(str(value).encode("utf-8")).hexdigest()
+            digest.update(f"{'/'.join(path + (str(key),))}\0{ident}\n".encode("utf-8"))
+
+    walk(code_dict, ())
+    return digest.hexdigest()
+
+
+def critique_code_dict(
+    code_dict: Dict[str, Any],
+    model=None,
+    max_workers=None,
+    token_budget=None,
+    keep_levels=None,
+) -> Dict[str, Any]:
+    """
+    Summarize a nested dict of parsed files (strings or LazyFile handles from
+    utils.parser) with a fixed token budget, as a hierarchical map-reduce:
+
+    1. Files are ranked by static roast-worthiness (utils.file_ranking) without
+       any LLM call. The budget (SUMMARY_TOKEN_BUDGET) is split over READMEs and
+       the SUMMARY_TOP_K worst offenders, and each file contributes that many
+       tokens of its start.
+    2. Map: the budgeted parts are packed per folder into chunks of up to
+       SUMMARY_CHUNK_TOKENS and CRITIQUE_BATCH_SIZE files. Each chunk is critiqued
+       by one LLM call, which answers with a JSON object of per-file critiques,
+       at most max_workers (default CRITIQUE_MAX_WORKERS) calls at a time.
+    3. Reduce: chunk critiques roll up per folder and then per repository. Where
+       the critiques exceed SUMMARY_REDUCE_TOKENS, the LLM merges them.
+
+    The number of LLM calls depends on the budget, not on the repository size.
+    The file selection is deterministic, and all calls go through the critique cache.
+    Concurrent calls for the same content, model and budget share one run
+    (CRITIQUE_FLIGHT) and get the same result dict, which must not be modified.
+    The LLM calls queue behind interactive roasts as BACKGROUND work; if the LLM
+    scheduler is saturated, LLMOverloadedError is raised before any of them.
+
+    Args:
+        code_dict (dict): Nested dict of parsed files.
+        model (str, optional): Model to use. Defaults to the model selected in the
+            Streamlit session, which has to be looked up here because worker threads
+            cannot see the session.
+        max_workers (int, optional): Concurrent LLM calls.
+        token_budget (int, optional): Tokens of code sent to the map stage.
+        keep_levels (int, optional): Levels of code_dict that keep their structure;
+            every folder at the last kept level becomes one summary. Defaults to 2
+            (section / repository) for parse_full_github_user results, else 1.
+
+    Returns:
+        dict: code_dict down to keep_levels, with summaries in place of files and folders.
+    """
+    if keep_levels is None:
+        keep_levels = 2 if "pinned_repos_code" in code_dict else 1
+    token_budget = SUMMARY_TOKEN_BUDGET if token_budget is None else token_budget
+    model = resolve_model_name(model)
+    key = (model, token_budget, keep_levels, code_dict_fingerprint(code_dict))
+    return CRITIQUE_FLIGHT.do(key, _critique_code_dict, code_dict, model, max_workers, token_budget, keep_levels)
+
+
+@STAGE_SECONDS.time(stage="critique")
+def _critique_code_dict(code_dict, model, max_workers, token_budget, keep_levels):
+    result = {}
+    files = []
+    dirs = defaultdict(list)
+    slots = []
+    _collect(code_dict, (), result, keep_levels, files, dirs, slots)
+    if not slots:
+        return result
+    # Admit the whole roast now; its map and reduce calls then queue as background work
+    LLM_SCHEDULER.check(BACKGROUND)
+
+    max_workers = max(1, max_workers or CRITIQUE_MAX_WORKERS)
+    scores = rank_files(files, GITHUB_MAX_CONCURRENCY)
+    allocation = allocate_tokens(files, token_budget, scores)
+    chunks = _build_chunks(files, allocation, SUMMARY_CHUNK_TOKENS, max(1, CRITIQUE_BATCH_SIZE))
+    worst = sorted(allocation, key=lambda path: -scores[path])[:5]
+    print("Worst offenders: " + ", ".join(f"{'/'.join(path)} ({scores[path]:.2f})" for path in worst))
+
+    group_critiques = defaultdict(list)
+    summaries = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="critique") as pool:
+        # Copy the caller's context so the GitHub request priority follows lazy file reads
+        # and every map and reduce call counts towards the roast's usage (utils.usage)
+        def submit(fn, *args):
+            return pool.submit(contextvars.copy_context().run, fn, *args)
+
+        with STAGE_SECONDS.time(stage="critique_map"):
+            futures = [submit(_critique_chunk, pieces, allocation, model) for _, pieces in chunks]
+            for (group, _), future in tqdm(zip(chunks, futures), total=len(futures), desc="Critiquing code", unit="chunk"):
+                group_critiques[group].append(future.result())
+
+        with STAGE_SECONDS.time(stage="critique_reduce"):
+            # Files at kept levels: merge the critiques of their parts
+            file_slots = [path for _, _, path in slots if path not in dirs]
+            futures = [submit(_reduce, path, group_critiques[path], model, SUMMARY_REDUCE_TOKENS) for path in file_slots]
+            for path, future in zip(file_slots, futures):
+                summaries[path] = future.result()
+
+            # Folders bottom-up: deepest first, all folders of one depth in parallel
+            for depth in sorted({len(path) for path in dirs}, reverse=True):
+                level = [path for path in dirs if len(path) == depth]
+                items = [
+                    group_critiques[path] + [f"{child[-1]}/: {summaries[child]}" for child in dirs[path] if summaries[child]]
+                    for path in level
+                ]
+                futures = [submit(_reduce, path, item, model, SUMMARY_REDUCE_TOKENS) for path, item in zip(level, items)]
+                for path, future in zip(level, futures):
+                    summaries[path] = future.result()
+
+    for parent, key, path in slots:
+        parent[key] = summaries.get(path) or "Critique skipped, summary token budget exhausted."
+
+    waits = LLM_SCHEDULER.stats()["classes"]
+    print("LLM queue wait (avg/p95): " + ", ".join(
+        f"{priority} {c['wait_avg']:.2f}s/{c['wait_p95']:.2f}s" for priority, c in waits.items()
+    ))
+    stats = CRITIQUE_CACHE.stats()
+    print(f"Summary: {len(allocation)}/{len(files)} files, {sum(allocation.values())} tokens in {len(chunks)} chunks. "
+          f"Critique cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
+    return result
@@ -0,0 +1,82 @@
+"""
+Token and cost accounting per roast.
+
+track_usage() opens a RoastUsage for the enclosed block. Every LLM call made
+inside it adds its prompt and completion tokens and its generation time. That
+includes the critique calls, whose worker threads run in a copy of the caller's
+context. Answers from the critique or roast cache, and calls joined from another
+request in flight, cost nothing and add nothing.
+
+Costs are estimates per backend:
+- OpenAI: tokens times OPENAI_PROMPT_COST_PER_MTOK / OPENAI_COMPLETION_COST_PER_MTOK.
+- Ollama: generation time times OLLAMA_COST_PER_HOUR (the hourly price of the GPU box).
+"""
+import contextvars
+import threading
+from contextlib import contextmanager
+
+from utils.settings import OPENAI_PROMPT_COST_PER_MTOK, OPENAI_COMPLETION_COST_PER_MTOK, OLLAMA_COST_PER_HOUR
+
+OLLAMA = "ollama"
+OPENAI = "openai"
+
+_current = contextvars.ContextVar("roast_usage", default=None)
+
+
+def estimate_cost(backend, prompt_tokens, completion_tokens, seconds):
+    """Estimated USD cost of LLM work on one backend."""
+    if backend == OPENAI:
+        return (prompt_tokens * OPENAI_PROMPT_COST_PER_MTOK + completion_tokens * OPENAI_COMPLETION_COST_PER_MTOK) / 1e6
+    return seconds / 3600 * OLLAMA_COST_PER_HOUR
+
+
+class RoastUsage:
+    def __init__(self):
+        self.backend = None
+        self.model = None
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.seconds = 0.0
+        self.cost = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, backend, model, prompt_tokens, completion_tokens, seconds):
+        with self._lock:
+            self.backend, self.model = backend, model
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens or 0
+            self.completion_tokens += completion_tokens or 0
+            self.seconds += seconds or 0.0
+            self.cost += estimate_cost(backend, prompt_tokens or 0, completion_tokens or 0, seconds or 0.0)
+
+    def as_dict(self):
+        """The columns stored with a clapback (see utils.db.insert_clapback)."""
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "model": self.model,
+                "llm_calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "generation_seconds": round(self.seconds, 3),
+                "open_api_cost": round(self.cost, 6),
+            }
+
+
+@contextmanager
+def track_usage():
+    """Collect the usage of all LLM calls made in the block into the yielded RoastUsage."""
+    usage = RoastUsage()
+    token = _current.set(usage)
+    try:
+        yield usage
+    finally:
+        _current.reset(token)
+
+
+def record_usage(backend, model, prompt_tokens, completion_tokens, seconds):
+    """Add one finished LLM call to the roast being tracked, if any."""
+    usage = _current.get()
+    if usage is not None:
+        usage.add(backend, model, prompt_tokens, completion_tokens, seconds)